@@ -0,0 +1,483 @@
+# Copyright (c) 2025-2025. aensidhe
+#
+# See LICENSE file.
+
+from pydantic_settings import BaseSettings
+from pydantic import Field, BaseModel, PrivateAttr, field_validator
+from typing import List, Union, Any, Tuple, Optional
+import pendulum
+from pendulum import Time, WeekDay, Date, DateTime
+import re
+import functools
+import logging
+import os
+import pickle
+import hashlib
+from pathlib import Path
+from types import MappingProxyType
+from datetime import date, time, timedelta
+from bisect import bisect_right
+
+log = logging.getLogger(__name__)
+
+_ONE_DAY = timedelta(days=1)
+
+# Day kinds as classified by Schedule._classify_day
+_DAY_REGULAR = 0
+_DAY_WEEKEND = 1
+_DAY_NONWORKING = 2
+_DAY_WORKING_WEEKEND = 3
+
+_WEEKDAY_MAP = MappingProxyType({
+    'Mon': WeekDay.MONDAY,
+    'Tue': WeekDay.TUESDAY,
+    'Wed': WeekDay.WEDNESDAY,
+    'Thu': WeekDay.THURSDAY,
+    'Fri': WeekDay.FRIDAY,
+    'Sat': WeekDay.SATURDAY,
+    'Sun': WeekDay.SUNDAY,
+    'Пн': WeekDay.MONDAY,
+    'Вт': WeekDay.TUESDAY,
+    'Ср': WeekDay.WEDNESDAY,
+    'Чт': WeekDay.THURSDAY,
+    'Пт': WeekDay.FRIDAY,
+    'Сб': WeekDay.SATURDAY,
+    'Вс': WeekDay.SUNDAY
+})
+_WEEKDAY_KEYS = tuple(_WEEKDAY_MAP)
+
+@functools.lru_cache(maxsize=None)
+def _named_timezone(name: str) -> pendulum.Timezone:
+    return pendulum.timezone(name)
+
+def resolve_timezone(timezone_setting: str) -> pendulum.Timezone:
+    """Resolve schedule timezone setting, "auto" stands for the local timezone"""
+    if timezone_setting == "auto":
+        # pendulum caches the local timezone itself
+        return pendulum.local_timezone()
+    return _named_timezone(timezone_setting)
+
+class AuthSettings(BaseModel):
+    api_id: int
+    api_hash: str
+    phone_number: str
+
+class Schedule(BaseModel):
+    name: str
+    parent: str = Field(default="")
+    start_of_day: Optional[Any] = Field(default=None)
+    end_of_day: Optional[Any] = Field(default=None)
+    timezone: str = Field(default="")
+    weekends: List[Any] = Field(default=[])
+    working_weekends: List[Union[str, List[str]]] = Field(default=[])
+    nonworking_weekdays: List[Union[str, List[str]]] = Field(default=[])
+
+    # Disjoint, sorted date overrides: interval start and end ordinals and _DAY_NONWORKING/_DAY_WORKING_WEEKEND
+    _override_starts: List[int] = PrivateAttr(default_factory=list)
+    _override_ends: List[int] = PrivateAttr(default_factory=list)
+    _override_kinds: List[int] = PrivateAttr(default_factory=list)
+    _weekend_values: frozenset = PrivateAttr(default=frozenset())
+    _days_until_weekday: List[int] = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context) -> None:
+        self._weekend_values = frozenset(wd.value for wd in self.weekends)
+        # For every weekday: number of days to the closest following day that is not a weekend, a week if there is none
+        self._days_until_weekday = [
+            next((k for k in range(1, 8) if (weekday + k) % 7 not in self._weekend_values), 7)
+            for weekday in range(7)
+        ]
+        self._build_overrides()
+
+    @field_validator('start_of_day')
+    @classmethod
+    def parse_start_of_day(cls, v: Any) -> Optional[Time]:
+        return cls._parse_time(v)
+
+    @field_validator('end_of_day')
+    @classmethod
+    def parse_end_of_day(cls, v: Any) -> Optional[Time]:
+        return cls._parse_time(v)
+
+    @staticmethod
+    def _parse_time(v: Any) -> Optional[Time]:
+        if v is None:
+            return None
+        if isinstance(v, Time):
+            return v
+        if isinstance(v, str):
+            try:
+                parsed = time.fromisoformat(v)
+            except ValueError:
+                raise ValueError(f"Cannot parse {v} as Time")
+            return Time(parsed.hour, parsed.minute, parsed.second, parsed.microsecond)
+        raise ValueError(f"Cannot parse {v} as Time")
+
+    @field_validator('weekends')
+    @classmethod
+    def parse_weekends(cls, v: Any) -> List[WeekDay]:
+        if not v:  # Handle empty list or None
+            return []
+        if not isinstance(v, list):
+            raise ValueError("weekends must be a list")
+
+        weekdays = []
+        for item in v:
+            if isinstance(item, WeekDay):
+                weekdays.append(item)
+            elif isinstance(item, str):
+                weekday = _WEEKDAY_MAP.get(item)
+                if weekday is None:
+                    raise ValueError(f"Unknown weekday: {item}. Supported: {list(_WEEKDAY_KEYS)}")
+                weekdays.append(weekday)
+            else:
+                raise ValueError(f"Cannot parse {item} as WeekDay")
+
+        return weekdays
+
+    @field_validator('working_weekends')
+    @classmethod
+    def parse_working_weekends(cls, v: Any) -> List[Union[Date, Tuple[Date, Date]]]:
+        if not isinstance(v, list):
+            raise ValueError("working_weekends must be a list")
+
+        return cls._parse_date_list(v, "working_weekends")
+
+    @field_validator('nonworking_weekdays')
+    @classmethod
+    def parse_nonworking_weekdays(cls, v: Any) -> List[Union[Date, Tuple[Date, Date]]]:
+        if not isinstance(v, list):
+            raise ValueError("nonworking_weekdays must be a list")
+
+        return cls._parse_date_list(v, "nonworking_weekdays")
+
+    @classmethod
+    def _parse_date_list(cls, v: List[Union[str, List[str]]], field_name: str) -> List[Union[Date, Tuple[Date, Date]]]:
+        parsed_dates = []
+
+        for item in v:
+            if isinstance(item, str):
+                parsed_dates.append(cls._parse_iso_date(item, field_name))
+            elif isinstance(item, list):
+                if len(item) != 2:
+                    raise ValueError(f"{field_name}: date interval must contain exactly 2 dates, got {len(item)}")
+                start_date = cls._parse_iso_date(item[0], field_name)
+                end_date = cls._parse_iso_date(item[1], field_name)
+                if start_date > end_date:
+                    raise ValueError(f"{field_name}: start date {item[0]} cannot be after end date {item[1]}")
+                parsed_dates.append((start_date, end_date))
+            else:
+                raise ValueError(f"{field_name}: each item must be a string (single date) or list of 2 strings (date interval)")
+
+        return parsed_dates
+
+    @staticmethod
+    def _parse_iso_date(date_str: str, field_name: str) -> Date:
+        if not isinstance(date_str, str):
+            raise ValueError(f"{field_name}: date must be a string in ISO8601 format (YYYY-MM-DD)")
+
+        # date.fromisoformat also accepts basic (YYYYMMDD) and week dates, keep config strict
+        if len(date_str) != 10 or date_str[4] != '-' or date_str[7] != '-':
+            raise ValueError(f"{field_name}: date '{date_str}' must be in ISO8601 format (YYYY-MM-DD)")
+
+        try:
+            parsed = date.fromisoformat(date_str)
+        except ValueError as e:
+            raise ValueError(f"{field_name}: invalid date '{date_str}': {e}")
+        return Date(parsed.year, parsed.month, parsed.day)
+
+    def get_next_working_day(self, timezone_setting: str = "auto", now: Optional[DateTime] = None) -> Date:
+        """Next working day counting from now, callers may pass their own now to share one clock reading"""
+        if now is None:
+            now = pendulum.now(resolve_timezone(timezone_setting))
+
+        # Walk over day ordinals, plain ints are much cheaper than Date objects
+        starting_day = now.date().toordinal()
+        if now.time() >= self.start_of_day:
+            starting_day += 1
+
+        # Without date overrides the answer is just the end of the current weekend run
+        if not self._override_starts:
+            weekday = (starting_day - 1) % 7
+            if weekday in self._weekend_values:
+                if len(self._weekend_values) == 7:
+                    raise RuntimeError(f"Schedule '{self.name}' has no working days left")
+                starting_day += self._days_until_weekday[weekday]
+            return Date.fromordinal(starting_day)
+
+        while True:
+            kind, override_index = self._classify_day(starting_day)
+            if kind == _DAY_NONWORKING:
+                # Jump over the whole nonworking interval at once
+                starting_day = self._override_ends[override_index] + 1
+            elif kind == _DAY_WEEKEND:
+                # Skip the rest of the weekend, but don't step over the next override
+                starting_day += self._days_until_weekday[(starting_day - 1) % 7]
+                next_index = override_index + 1
+                if next_index < len(self._override_starts):
+                    if self._override_starts[next_index] < starting_day:
+                        starting_day = self._override_starts[next_index]
+                elif len(self._weekend_values) == 7:
+                    # Every day is a weekend and no working weekends are left
+                    raise RuntimeError(f"Schedule '{self.name}' has no working days left")
+            else:
+                return Date.fromordinal(starting_day)
+
+    def _is_working_day(self, date: Date) -> bool:
+        kind, _ = self._classify_day(date.toordinal())
+        return kind == _DAY_REGULAR or kind == _DAY_WORKING_WEEKEND
+
+    def _classify_day(self, ordinal: int) -> Tuple[int, int]:
+        """Classify the day ordinal, also return index of the last override starting on or before it"""
+        i = bisect_right(self._override_starts, ordinal) - 1
+        if i >= 0 and self._override_ends[i] >= ordinal:
+            return self._override_kinds[i], i
+        # Ordinal 1 (0001-01-01) is a Monday
+        if (ordinal - 1) % 7 in self._weekend_values:
+            return _DAY_WEEKEND, i
+        return _DAY_REGULAR, i
+
+    def _build_overrides(self) -> None:
+        """Merge working_weekends and nonworking_weekdays into one sorted list of disjoint intervals"""
+        nonworking = self._merge_intervals(self.nonworking_weekdays)
+        # Nonworking days have priority, so cut them out of working weekends
+        working = self._subtract_intervals(self._merge_intervals(self.working_weekends), nonworking)
+
+        overrides = sorted(
+            [(start, end, _DAY_NONWORKING) for start, end in nonworking] +
+            [(start, end, _DAY_WORKING_WEEKEND) for start, end in working]
+        )
+        self._override_starts = [start.toordinal() for start, _, _ in overrides]
+        self._override_ends = [end.toordinal() for _, end, _ in overrides]
+        self._override_kinds = [kind for _, _, kind in overrides]
+
+    @staticmethod
+    def _merge_intervals(items: List[Union[Date, Tuple[Date, Date]]]) -> List[Tuple[Date, Date]]:
+        """Turn single dates and intervals into sorted, non-overlapping intervals"""
+        merged = []
+        for start_date, end_date in sorted(item if isinstance(item, tuple) else (item, item) for item in items):
+            if merged and start_date <= merged[-1][1] + _ONE_DAY:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end_date))
+            else:
+                merged.append((start_date, end_date))
+        return merged
+
+    @staticmethod
+    def _subtract_intervals(intervals: List[Tuple[Date, Date]], removed: List[Tuple[Date, Date]]) -> List[Tuple[Date, Date]]:
+        """Remove days covered by removed intervals, both lists must be sorted and non-overlapping"""
+        result = []
+        for start_date, end_date in intervals:
+            for removed_start, removed_end in removed:
+                if removed_end < start_date or removed_start > end_date:
+                    continue
+                if removed_start > start_date:
+                    result.append((start_date, removed_start - _ONE_DAY))
+                start_date = removed_end + _ONE_DAY
+                if start_date > end_date:
+                    break
+            if start_date <= end_date:
+                result.append((start_date, end_date))
+        return result
+
+    """Check if current time is within working hours (between start_of_day and end_of_day)"""
+    def is_working_hours(self, now: DateTime) -> bool:
+        start_of_day = self.start_of_day
+        end_of_day = self.end_of_day
+
+        # Check if current time is between start_of_day and end_of_day
+        return self._is_working_day(now.date()) and start_of_day <= now.time() <= end_of_day
+
+class GroupSetting(BaseModel):
+    name: str = Field(default="")
+    name_pattern: str = Field(default="")
+    schedule: str
+
+    _compiled_pattern: Optional[re.Pattern] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context) -> None:
+        if not self.name and not self.name_pattern:
+            raise ValueError("Either 'name' or 'name_pattern' must be specified")
+        if self.name and self.name_pattern:
+            raise ValueError("'name' and 'name_pattern' are mutually exclusive")
+        # Compiled once here, the pattern is matched against every dialog name
+        if self.name_pattern:
+            try:
+                self._compiled_pattern = re.compile(self.name_pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid name_pattern {self.name_pattern!r}: {e}")
+
+
+
+class ScheduleManager:
+    def __init__(self, schedules: List[Schedule], group_settings: List[GroupSetting] = None):
+        self.schedules = {s.name: s for s in schedules}
+        self.group_settings = group_settings or []
+        self._effective_schedules = {}
+
+        # Validate schedules
+        if 'default' not in self.schedules:
+            raise ValueError("Schedule 'default' must be defined")
+
+        # Validate parent references
+        for schedule in schedules:
+            if schedule.parent and schedule.parent not in self.schedules:
+                raise ValueError(f"Schedule '{schedule.name}' references unknown parent '{schedule.parent}'")
+
+        # Check for circular dependencies
+        self._validate_no_circular_dependencies()
+
+    def _validate_no_circular_dependencies(self):
+        for schedule_name in self.schedules:
+            visited = set()
+            current = schedule_name
+
+            while current:
+                if current in visited:
+                    raise ValueError(f"Circular dependency detected in schedule hierarchy involving '{schedule_name}'")
+                visited.add(current)
+                current = self.schedules[current].parent
+
+    def _resolve_schedule_property(self, schedule_name: str, property_name: str):
+        """Resolve a property value by walking up the parent chain"""
+        current = schedule_name
+
+        while current:
+            schedule = self.schedules[current]
+            value = getattr(schedule, property_name)
+
+            # None, "" and [] all mean the property is not set here (times are truthy, even midnight)
+            if value:
+                return value
+
+            current = schedule.parent
+
+        # If we reach here without finding a value, return appropriate default
+        if property_name == 'timezone':
+            return "auto"
+        elif property_name in ['weekends', 'working_weekends', 'nonworking_weekdays']:
+            return []
+        else:
+            return None
+
+    def get_effective_schedule(self, schedule_name: str) -> Schedule:
+        """Get the effective schedule by resolving all properties through inheritance"""
+        if schedule_name not in self.schedules:
+            schedule_name = 'default'
+
+        # Inheritance is resolved once per schedule, the result is reused for every group
+        effective_schedule = self._effective_schedules.get(schedule_name)
+        if effective_schedule is None:
+            effective_schedule = self._build_effective_schedule(schedule_name)
+            self._effective_schedules[schedule_name] = effective_schedule
+        return effective_schedule
+
+    def _build_effective_schedule(self, schedule_name: str) -> Schedule:
+        # Create an effective schedule by resolving all properties
+        start_of_day_raw = self._resolve_schedule_property(schedule_name, 'start_of_day')
+        end_of_day_raw = self._resolve_schedule_property(schedule_name, 'end_of_day')
+        timezone = self._resolve_schedule_property(schedule_name, 'timezone')
+        weekends_raw = self._resolve_schedule_property(schedule_name, 'weekends')
+        working_weekends_raw = self._resolve_schedule_property(schedule_name, 'working_weekends')
+        nonworking_weekdays_raw = self._resolve_schedule_property(schedule_name, 'nonworking_weekdays')
+
+        # Resolved values come from validated schedules already, so skip validating them again
+        effective_schedule = Schedule.model_construct(
+            name=f"_effective_{schedule_name}",
+            start_of_day=start_of_day_raw or Time(9, 0, 0),
+            end_of_day=end_of_day_raw or Time(19, 0, 0),
+            timezone=timezone or "auto",
+            weekends=list(weekends_raw or []),
+            working_weekends=list(working_weekends_raw or []),
+            nonworking_weekdays=list(nonworking_weekdays_raw or [])
+        )
+
+        return effective_schedule
+
+    def get_schedule_for_group(self, group_name: str) -> Schedule:
+        """Get the appropriate schedule for a group based on group settings"""
+        # First try exact name match
+        for group_setting in self.group_settings:
+            if group_setting.name and group_setting.name == group_name:
+                return self.get_effective_schedule(group_setting.schedule)
+
+        # Then try pattern match from top to bottom
+        for group_setting in self.group_settings:
+            if group_setting.name_pattern and group_setting._compiled_pattern.match(group_name):
+                return self.get_effective_schedule(group_setting.schedule)
+
+        # Default to 'default' schedule
+        return self.get_effective_schedule('default')
+
+class Settings(BaseSettings):
+    auth: AuthSettings
+    schedules: List[Schedule] = Field(default=[])
+    group_settings: List[GroupSetting] = Field(default=[])
+
+    def get_schedule_manager(self) -> ScheduleManager:
+        """Get schedule manager"""
+        if not self.schedules:
+            raise ValueError("schedules must be defined")
+
+        return ScheduleManager(self.schedules, self.group_settings)
+
+@functools.lru_cache(maxsize=1)
+def _settings_cache_version() -> str:
+    """Hash of this module's source, so data cached by other code versions is never reused"""
+    return hashlib.sha1(Path(__file__).read_bytes()).hexdigest()
+
+def _settings_cache_path(file_path: str) -> Path:
+    cache_dir = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "telegram-muter"
+    key = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()
+    return cache_dir / f"config-{key}.pkl"
+
+def _settings_data(settings: Settings) -> dict:
+    """Dump validated field values as is (model_dump would serialize parsed dates back)"""
+    return {
+        "auth": dict(settings.auth),
+        "schedules": [dict(schedule) for schedule in settings.schedules],
+        "group_settings": [dict(group_setting) for group_setting in settings.group_settings]
+    }
+
+def _construct_settings(data: dict) -> Settings:
+    """Rebuild Settings from already validated data without running validators again"""
+    return Settings.model_construct(
+        auth=AuthSettings.model_construct(**data["auth"]),
+        schedules=[Schedule.model_construct(**schedule) for schedule in data["schedules"]],
+        group_settings=[GroupSetting.model_construct(**group_setting) for group_setting in data["group_settings"]]
+    )
+
+def _write_private(path: Path, data: bytes):
+    """Write a file readable by the owner only, the cached settings contain credentials"""
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    # Replace at once, so an existing cache file with wider permissions is not reused
+    os.replace(tmp_path, path)
+
+def load_settings_from_toml(file_path: str) -> Settings:
+    """Load settings from TOML, reusing the validated result while the file is unchanged"""
+    stat = os.stat(file_path)
+    cache_key = (_settings_cache_version(), stat.st_mtime_ns, stat.st_size)
+    cache_path = _settings_cache_path(file_path)
+
+    try:
+        cached_key, cached_data = pickle.loads(cache_path.read_bytes())
+        if cached_key == cache_key:
+            return _construct_settings(cached_data)
+    except Exception:
+        # Missing, stale or unreadable cache - fall back to full validation
+        pass
+
+    # Only needed on a cache miss, so don't pay for importing the parser up front
+    import tomllib
+    with open(file_path, "rb") as file:
+        toml_content = tomllib.load(file)
+    settings = Settings(**toml_content)
+
+    try:
+        _write_private(cache_path, pickle.dumps((cache_key, _settings_data(settings))))
+    except OSError as e:
+        log.warning(f"Cannot write settings cache {cache_path}: {e}")
+
+    return settings
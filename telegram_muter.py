@@ -8,425 +8,324 @@ from getpass import getpass
 from telethon import TelegramClient
 from telethon.errors.rpcerrorlist import SessionPasswordNeededError, FloodWaitError
 from telethon.tl.functions.account import UpdateNotifySettingsRequest, GetNotifySettingsRequest
-from telethon.tl.types import InputPeerNotifySettings, InputPeerChannel, Chat, InputPeerChat, User
+from telethon.tl.types import InputPeerNotifySettings, PeerNotifySettings, Chat, User
 
-from pydantic_settings import BaseSettings
-from pydantic import Field, BaseModel, field_validator
-from typing import List, Union, Any, Tuple, Optional
 import pendulum
-from pendulum import Time, WeekDay, Date, DateTime
-import tomllib
-import re
-
-class AuthSettings(BaseModel):
-    api_id: int
-    api_hash: str
-    phone_number: str
-
-class Schedule(BaseModel):
-    name: str
-    parent: str = Field(default="")
-    start_of_day: Optional[Any] = Field(default=None)
-    end_of_day: Optional[Any] = Field(default=None)
-    timezone: str = Field(default="")
-    weekends: List[Any] = Field(default=[])
-    working_weekends: List[Union[str, List[str]]] = Field(default=[])
-    nonworking_weekdays: List[Union[str, List[str]]] = Field(default=[])
-
-    @field_validator('start_of_day')
-    @classmethod
-    def parse_start_of_day(cls, v: Any) -> Optional[Time]:
-        if v is None:
-            return None
-        if isinstance(v, Time):
-            return v
-        if isinstance(v, str):
-            return pendulum.parse(v).time()
-        raise ValueError(f"Cannot parse {v} as Time")
-
-    @field_validator('end_of_day')
-    @classmethod
-    def parse_end_of_day(cls, v: Any) -> Optional[Time]:
-        if v is None:
-            return None
-        if isinstance(v, Time):
-            return v
-        if isinstance(v, str):
-            return pendulum.parse(v).time()
-        raise ValueError(f"Cannot parse {v} as Time")
-
-    @field_validator('weekends')
-    @classmethod
-    def parse_weekends(cls, v: Any) -> List[WeekDay]:
-        if not v:  # Handle empty list or None
-            return []
-        if not isinstance(v, list):
-            raise ValueError("weekends must be a list")
-
-        weekdays = []
-        for item in v:
-            if isinstance(item, WeekDay):
-                weekdays.append(item)
-            elif isinstance(item, str):
-                weekday_map = {
-                    'Mon': WeekDay.MONDAY,
-                    'Tue': WeekDay.TUESDAY,
-                    'Wed': WeekDay.WEDNESDAY,
-                    'Thu': WeekDay.THURSDAY,
-                    'Fri': WeekDay.FRIDAY,
-                    'Sat': WeekDay.SATURDAY,
-                    'Sun': WeekDay.SUNDAY,
-                    'Пн': WeekDay.MONDAY,
-                    'Вт': WeekDay.TUESDAY,
-                    'Ср': WeekDay.WEDNESDAY,
-                    'Чт': WeekDay.THURSDAY,
-                    'Пт': WeekDay.FRIDAY,
-                    'Сб': WeekDay.SATURDAY,
-                    'Вс': WeekDay.SUNDAY
-                }
-                if item in weekday_map:
-                    weekdays.append(weekday_map[item])
-                else:
-                    raise ValueError(f"Unknown weekday: {item}. Supported: {list(weekday_map.keys())}")
-            else:
-                raise ValueError(f"Cannot parse {item} as WeekDay")
-
-        return weekdays
-
-    @field_validator('working_weekends')
-    @classmethod
-    def parse_working_weekends(cls, v: Any) -> List[Union[Date, Tuple[Date, Date]]]:
-        if not isinstance(v, list):
-            raise ValueError("working_weekends must be a list")
-
-        return cls._parse_date_list(v, "working_weekends")
-
-    @field_validator('nonworking_weekdays')
-    @classmethod
-    def parse_nonworking_weekdays(cls, v: Any) -> List[Union[Date, Tuple[Date, Date]]]:
-        if not isinstance(v, list):
-            raise ValueError("nonworking_weekdays must be a list")
-
-        return cls._parse_date_list(v, "nonworking_weekdays")
-
-    @classmethod
-    def _parse_date_list(cls, v: List[Union[str, List[str]]], field_name: str) -> List[Union[Date, Tuple[Date, Date]]]:
-        parsed_dates = []
-
-        for item in v:
-            if isinstance(item, str):
-                parsed_dates.append(cls._parse_iso_date(item, field_name))
-            elif isinstance(item, list):
-                if len(item) != 2:
-                    raise ValueError(f"{field_name}: date interval must contain exactly 2 dates, got {len(item)}")
-                start_date = cls._parse_iso_date(item[0], field_name)
-                end_date = cls._parse_iso_date(item[1], field_name)
-                if start_date > end_date:
-                    raise ValueError(f"{field_name}: start date {item[0]} cannot be after end date {item[1]}")
-                parsed_dates.append((start_date, end_date))
-            else:
-                raise ValueError(f"{field_name}: each item must be a string (single date) or list of 2 strings (date interval)")
-
-        return parsed_dates
-
-    @staticmethod
-    def _parse_iso_date(date_str: str, field_name: str) -> Date:
-        if not isinstance(date_str, str):
-            raise ValueError(f"{field_name}: date must be a string in ISO8601 format (YYYY-MM-DD)")
-
-        if not re.match(r'^\d{4}-\d{2}-\d{2}$', date_str):
-            raise ValueError(f"{field_name}: date '{date_str}' must be in ISO8601 format (YYYY-MM-DD)")
+from pendulum import DateTime
+import functools
+import os
+import random
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, List, Tuple
+
+# Configuration and schedules live in muter_config, which doesn't need telethon. Re-exported for convenience.
+from muter_config import (  # noqa: F401
+    AuthSettings, Schedule, GroupSetting, ScheduleManager, Settings, load_settings_from_toml, resolve_timezone
+)
+
+log = logging.getLogger(__name__)
+
+# How many Telegram requests may be in flight at once
+MAX_CONCURRENT_REQUESTS = 8
+# How many times a request is tried before giving up, and the longest FloodWait worth waiting for
+MAX_RETRIES = 8
+MAX_FLOOD_WAIT = 600
+
+# Global settings, loaded by main() so that importing the module does no I/O
+settings = None
+
+@functools.lru_cache(maxsize=1)
+def get_settings(path: str = "config.toml") -> Optional[Settings]:
+    """Load settings from the config file once, None if there is no config file"""
+    if not os.path.exists(path):
+        return None
+    return load_settings_from_toml(path)
+
+class AdaptiveTokenBucket:
+    """Client-side rate limiter: the rate grows on every success and is halved on FloodWait"""
+
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.1, max_rate: float = 20.0,
+                 capacity: float = MAX_CONCURRENT_REQUESTS, increase: float = 1.0, decrease: float = 0.5):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.capacity = capacity
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = capacity
+        self._updated = None
+
+    async def acquire(self):
+        """Take a token, waiting until it is refilled if the bucket is empty"""
+        now = asyncio.get_running_loop().time()
+        if self._updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # Reserve the token right away, so concurrent callers queue up behind each other
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+    def increase_rate(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def decrease_rate(self):
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+
+# Shared by all requests, Telegram limits are per account
+rate_limiter = AdaptiveTokenBucket()
 
+async def handle_rate_limit(operation, *args, **kwargs):
+    """Common handler for Telegram rate limiting using FloodWaitError, also retries network errors with backoff"""
+    for attempt in range(MAX_RETRIES):
+        last_attempt = attempt == MAX_RETRIES - 1
+        await rate_limiter.acquire()
         try:
-            return pendulum.parse(date_str).date()
-        except Exception as e:
-            raise ValueError(f"{field_name}: invalid date '{date_str}': {e}")
-
-    def get_next_working_day(self, timezone_setting: str = "auto") -> Date:
-        if timezone_setting == "auto":
-            tz = pendulum.local_timezone()
+            result = await operation(*args, **kwargs)
+        except FloodWaitError as e:
+            rate_limiter.decrease_rate()
+            # Waits of several hours do happen, give up instead of hanging the run
+            if e.seconds > MAX_FLOOD_WAIT or last_attempt:
+                raise
+            log.warning(f"Rate limited by Telegram. Waiting {e.seconds} seconds...")
+            await asyncio.sleep(e.seconds)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            if last_attempt:
+                raise
+            delay = min(MAX_FLOOD_WAIT, 2 ** attempt + random.uniform(0, 1))
+            log.warning(f"Network error: {e}. Retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
         else:
-            tz = pendulum.timezone(timezone_setting)
+            rate_limiter.increase_rate()
+            return result
 
-        now = pendulum.now(tz)
+def get_peer_for_dialog(dialog):
+    """Get appropriate peer type for a dialog"""
+    entity = dialog.entity
+    # Telethon already built the input peer (InputPeerChat/InputPeerChannel) when it created the dialog.
+    # Megagroups are channels with broadcast unset, entities without the flag are not groups.
+    if isinstance(entity, Chat) or not getattr(entity, 'broadcast', True):
+        return dialog.input_entity
+    return None
 
-        if now.time() < self.start_of_day:
-            starting_day = now.date()
-        else:
-            starting_day = now.date().add(days=1)
+async def iter_dialogs(client):
+    """Stream dialogs of a client, retrying a failed page request under the same policy as other requests"""
+    dialogs = client.iter_dialogs()
+    while True:
+        try:
+            try:
+                dialog = await dialogs.__anext__()
+            except (FloodWaitError, ConnectionError, asyncio.TimeoutError):
+                # Pages are requested by the iterator itself, a failed one is requested again from the same offset
+                dialog = await handle_rate_limit(dialogs.__anext__)
+        except StopAsyncIteration:
+            return
+        yield dialog
+
+async def get_group_dialogs(dialogs):
+    """Yield (dialog, peer) pairs for the dialogs that can be muted, reporting the skipped ones"""
+    async for dialog in dialogs:
+        # Groups we left stay in the dialog list, but there is nothing to mute there
+        if getattr(dialog.entity, 'left', False):
+            log.info(f"Skipped: {dialog.name}, not a member")
+            continue
+        peer = get_peer_for_dialog(dialog)
+        if peer is None:
+            # Private chats are skipped silently
+            if not isinstance(dialog.entity, User):
+                log.info(f"Skipped: {dialog.name}, unknown peer type")
+            continue
+        yield dialog, peer
+
+async def run_dialog_tasks(dialogs, operation, action: str) -> List[Tuple[object, object]]:
+    """Run operation(dialog, peer) for all (dialog, peer) pairs concurrently, return (dialog, result or exception) pairs"""
+    tasks = []
+    flood_waits = []
+
+    def give_up(e: FloodWaitError):
+        # handle_rate_limit gave up, so the account is banned for a while.
+        # Cancel the other chats instead of sending them into the ban, and fail the whole run.
+        flood_waits.append(e)
+        current = asyncio.current_task()
+        for _, task in tasks:
+            if task is not current:
+                task.cancel()
+
+    async def run(dialog, peer):
+        try:
+            return await operation(dialog, peer)
+        except FloodWaitError as e:
+            give_up(e)
+            raise
 
-        while not self._is_working_day(starting_day):
-            starting_day = starting_day.add(days=1)
+    try:
+        try:
+            async for dialog, peer in dialogs:
+                if flood_waits:
+                    break
+                tasks.append((dialog, asyncio.create_task(run(dialog, peer))))
+        except FloodWaitError as e:
+            # Dialog paging gave up the same way
+            give_up(e)
+        results = await asyncio.gather(*(task for _, task in tasks), return_exceptions=True)
+    except BaseException:
+        for _, task in tasks:
+            task.cancel()
+        raise
+
+    if flood_waits:
+        done_count = sum(1 for result in results if result is True)
+        log.error(f"Rate limited by Telegram for {flood_waits[0].seconds} seconds, giving up. "
+                  f"Chats {action} before that: {done_count}")
+        raise flood_waits[0]
+    return [(dialog, result) for (dialog, _), result in zip(tasks, results)]
+
+async def get_notify_settings(client, dialog, peer):
+    """Get notify settings of a dialog, reusing the ones that came with the dialog list if present"""
+    notify_settings = getattr(dialog.dialog, 'notify_settings', None)
+    if isinstance(notify_settings, PeerNotifySettings):
+        return notify_settings
+    return await handle_rate_limit(client, GetNotifySettingsRequest(peer=peer))
+
+@functools.lru_cache(maxsize=64)
+def get_mute_settings(mute_until: int) -> InputPeerNotifySettings:
+    """Notify settings muting until the given unix timestamp, shared by all chats muted until then"""
+    return InputPeerNotifySettings(
+        mute_until=mute_until,
+        show_previews=False
+    )
 
-        return starting_day
+async def connect_client() -> TelegramClient:
+    """Connect to the Telegram API, signing in if the session is not authorized yet"""
+    auth = settings.auth
+    client = TelegramClient('ru.aensidhe.console_groups_muter', auth.api_id, auth.api_hash)
+    await client.connect()
 
-    def _is_working_day(self, date: Date) -> bool:
-        weekday = date.weekday()
-        # Check if this day is marked as nonworking (highest priority)
-        if self._is_nonworking_weekday(date):
+    # Ensure you're authorized
+    if not await client.is_user_authorized():
+        await client.send_code_request(auth.phone_number)
+        try:
+            await client.sign_in(auth.phone_number, input('Enter the code: '))
+        except SessionPasswordNeededError:
+            await client.sign_in(auth.phone_number, password=getpass('Enter 2FA password: '))
+
+    # Raise every FloodWait instead of sleeping through it, so handle_rate_limit waits and slows down the rate limiter
+    client.flood_sleep_threshold = 0
+    return client
+
+# Notify settings for unmuted chats, the same object is sent for every chat
+UNMUTE_SETTINGS = InputPeerNotifySettings(
+    mute_until=None,
+    show_previews=True
+)
+
+async def unmute_dialog(client, dialog, peer, target_mute_until: DateTime, semaphore: asyncio.Semaphore) -> bool:
+    """Unmute a single dialog if it is muted until target_mute_until, return True if it was unmuted"""
+    name = dialog.name
+    async with semaphore:
+        # Check if the group is muted until the target time
+        notify_settings = await get_notify_settings(client, dialog, peer)
+
+        if not (notify_settings and
+                notify_settings.mute_until and
+                notify_settings.mute_until == target_mute_until):
+            log.info(f"Skipped chat: {name} (not muted until target time)")
             return False
 
-        is_weekend = weekday in [wd.value for wd in self.weekends]
-        if is_weekend:
-            # Weekend, but not nonworking - check if it's a working weekend
-            return self._is_working_weekend(date)
-        else:
-            # Regular weekday and not nonworking weekday
-            return True
-
-    def _is_working_weekend(self, date: Date) -> bool:
-        for item in self.working_weekends:
-            if isinstance(item, Date):
-                if date == item:
-                    return True
-            elif isinstance(item, tuple):
-                start_date, end_date = item
-                if start_date <= date <= end_date:
-                    return True
-        return False
+        # Unmute the chat
+        await handle_rate_limit(client, UpdateNotifySettingsRequest(
+            peer=peer,
+            settings=UNMUTE_SETTINGS
+        ))
+    log.info(f"Unmuted chat: {name}")
+    return True
+
+async def unmute_dialogs(client, target_mute_until: DateTime) -> Tuple[int, int]:
+    """Unmute all group dialogs of a connected client muted until target_mute_until, return how many were unmuted and failed"""
+    # Unmute dialogs concurrently, bounded the same way as muting
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    results = await run_dialog_tasks(
+        get_group_dialogs(iter_dialogs(client)),
+        lambda dialog, peer: unmute_dialog(client, dialog, peer, target_mute_until, semaphore),
+        "unmuted"
+    )
 
-    def _is_nonworking_weekday(self, date: Date) -> bool:
-        for item in self.nonworking_weekdays:
-            if isinstance(item, Date):
-                if date == item:
-                    return True
-            elif isinstance(item, tuple):
-                start_date, end_date = item
-                if start_date <= date <= end_date:
-                    return True
-        return False
+    unmuted_count = 0
+    failed_count = 0
+    for dialog, result in results:
+        if isinstance(result, Exception):
+            log.warning(f"Failed to unmute chat {dialog.name}: {result}")
+            failed_count += 1
+        elif result:
+            unmuted_count += 1
+    return unmuted_count, failed_count
 
-    """Check if current time is within working hours (between start_of_day and end_of_day)"""
-    def is_working_hours(self, now: DateTime) -> bool:
-        start_of_day = self.start_of_day
-        end_of_day = self.end_of_day
-
-        # Check if current time is between start_of_day and end_of_day
-        return self._is_working_day(now.date()) and start_of_day <= now.time() <= end_of_day
-
-class GroupSetting(BaseModel):
-    name: str = Field(default="")
-    name_pattern: str = Field(default="")
-    schedule: str
-
-    def model_post_init(self, __context) -> None:
-        if not self.name and not self.name_pattern:
-            raise ValueError("Either 'name' or 'name_pattern' must be specified")
-        if self.name and self.name_pattern:
-            raise ValueError("'name' and 'name_pattern' are mutually exclusive")
-
-
-
-class ScheduleManager:
-    def __init__(self, schedules: List[Schedule], group_settings: List[GroupSetting] = None):
-        self.schedules = {s.name: s for s in schedules}
-        self.group_settings = group_settings or []
-
-        # Validate schedules
-        if 'default' not in self.schedules:
-            raise ValueError("Schedule 'default' must be defined")
-
-        # Validate parent references
-        for schedule in schedules:
-            if schedule.parent and schedule.parent not in self.schedules:
-                raise ValueError(f"Schedule '{schedule.name}' references unknown parent '{schedule.parent}'")
-
-        # Check for circular dependencies
-        self._validate_no_circular_dependencies()
-
-    def _validate_no_circular_dependencies(self):
-        for schedule_name in self.schedules:
-            visited = set()
-            current = schedule_name
-
-            while current:
-                if current in visited:
-                    raise ValueError(f"Circular dependency detected in schedule hierarchy involving '{schedule_name}'")
-                visited.add(current)
-                current = self.schedules[current].parent
-
-    def _resolve_schedule_property(self, schedule_name: str, property_name: str):
-        """Resolve a property value by walking up the parent chain"""
-        current = schedule_name
-
-        while current:
-            schedule = self.schedules[current]
-            value = getattr(schedule, property_name)
-
-            # For start_of_day, end_of_day and timezone, check for None/"" specifically
-            if property_name in ['start_of_day', 'end_of_day', 'timezone']:
-                if value is not None and value != "":
-                    return value
-            # For lists, check if they're not empty
-            elif isinstance(value, list) and value:
-                return value
-
-            current = schedule.parent
-
-        # If we reach here without finding a value, return appropriate default
-        if property_name == 'timezone':
-            return "auto"
-        elif property_name in ['weekends', 'working_weekends', 'nonworking_weekdays']:
-            return []
-        else:
-            return None
-
-    def get_effective_schedule(self, schedule_name: str) -> Schedule:
-        """Get the effective schedule by resolving all properties through inheritance"""
-        if schedule_name not in self.schedules:
-            schedule_name = 'default'
-
-        # Create an effective schedule by resolving all properties
-        start_of_day_raw = self._resolve_schedule_property(schedule_name, 'start_of_day')
-        end_of_day_raw = self._resolve_schedule_property(schedule_name, 'end_of_day')
-        timezone = self._resolve_schedule_property(schedule_name, 'timezone')
-        weekends_raw = self._resolve_schedule_property(schedule_name, 'weekends')
-        working_weekends_raw = self._resolve_schedule_property(schedule_name, 'working_weekends')
-        nonworking_weekdays_raw = self._resolve_schedule_property(schedule_name, 'nonworking_weekdays')
-
-        # Convert resolved properties back to strings for Schedule creation
-        start_of_day = start_of_day_raw.isoformat() if start_of_day_raw else "09:00:00"
-        end_of_day = end_of_day_raw.isoformat() if end_of_day_raw else "19:00:00"
-
-        # Convert weekends back to strings
-        weekends = []
-        if weekends_raw:
-            weekday_name_map = {
-                WeekDay.MONDAY: "Mon", WeekDay.TUESDAY: "Tue", WeekDay.WEDNESDAY: "Wed",
-                WeekDay.THURSDAY: "Thu", WeekDay.FRIDAY: "Fri", WeekDay.SATURDAY: "Sat", WeekDay.SUNDAY: "Sun"
-            }
-            for wd in weekends_raw:
-                if isinstance(wd, WeekDay):
-                    weekends.append(weekday_name_map[wd])
-                else:
-                    weekends.append(wd)
-
-        # Convert date lists back to string format
-        def convert_date_list_to_strings(date_list):
-            if not date_list:
-                return []
-            result = []
-            for item in date_list:
-                if isinstance(item, Date):
-                    result.append(item.isoformat())
-                elif isinstance(item, tuple) and len(item) == 2:
-                    result.append([item[0].isoformat(), item[1].isoformat()])
-                else:
-                    result.append(item)
-            return result
+"""Unmute all chats that are muted until start_of_day next working day"""
+async def unmute_chats():
+    log.info("Starting unmute operation...")
 
-        working_weekends = convert_date_list_to_strings(working_weekends_raw)
-        nonworking_weekdays = convert_date_list_to_strings(nonworking_weekdays_raw)
-
-        # Create effective schedule with resolved properties
-        effective_schedule = Schedule(
-            name=f"_effective_{schedule_name}",
-            start_of_day=start_of_day,
-            end_of_day=end_of_day,
-            timezone=timezone or "auto",
-            weekends=weekends,
-            working_weekends=working_weekends,
-            nonworking_weekdays=nonworking_weekdays
-        )
+    if settings is None:
+        raise RuntimeError("Settings not loaded")
 
-        return effective_schedule
-
-    def get_schedule_for_group(self, group_name: str) -> Schedule:
-        """Get the appropriate schedule for a group based on group settings"""
-        # First try exact name match
-        for group_setting in self.group_settings:
-            if group_setting.name and group_setting.name == group_name:
-                return self.get_effective_schedule(group_setting.schedule)
-
-        # Then try pattern match from top to bottom
-        for group_setting in self.group_settings:
-            if group_setting.name_pattern and re.match(group_setting.name_pattern, group_name):
-                return self.get_effective_schedule(group_setting.schedule)
-
-        # Default to 'default' schedule
-        return self.get_effective_schedule('default')
-
-class Settings(BaseSettings):
-    auth: AuthSettings
-    schedules: List[Schedule] = Field(default=[])
-    group_settings: List[GroupSetting] = Field(default=[])
-
-    def get_schedule_manager(self) -> ScheduleManager:
-        """Get schedule manager"""
-        if not self.schedules:
-            raise ValueError("schedules must be defined")
-
-        return ScheduleManager(self.schedules, self.group_settings)
-
-def load_settings_from_toml(file_path: str) -> Settings:
-    with open(file_path, "rb") as file:
-        toml_content = tomllib.load(file)
-    return Settings(**toml_content)
-
-# Global settings - only load if config exists and we're not in test mode
-try:
-    import os
-    if os.path.exists("config.toml") and 'pytest' not in os.environ.get('_', ''):
-        settings = load_settings_from_toml("config.toml")
-        schedule_manager = settings.get_schedule_manager()
-    else:
-        settings = None
-        schedule_manager = None
-except:
-    settings = None
-    schedule_manager = None
+    client = await connect_client()
 
-async def handle_rate_limit(operation, *args, **kwargs):
-    """Common handler for Telegram rate limiting using FloodWaitError"""
-    while True:
-        try:
-            return await operation(*args, **kwargs)
-        except FloodWaitError as e:
-            print(f"Rate limited by Telegram. Waiting {e.seconds} seconds...")
-            await asyncio.sleep(e.seconds)
+    try:
+        # Get default schedule for unmuting calculation
+        schedule_manager_instance = settings.get_schedule_manager()
+        default_schedule = schedule_manager_instance.get_effective_schedule('default')
 
-async def get_peer_for_dialog(dialog):
-    """Get appropriate peer type for a dialog"""
-    if isinstance(dialog.entity, Chat):
-        return InputPeerChat(dialog.entity.id)
-    elif hasattr(dialog.entity, 'broadcast') and not dialog.entity.broadcast:
-        return InputPeerChannel(dialog.entity.id, dialog.entity.access_hash)
-    return None
+        # Calculate the target mute_until time (start_of_day next working day)
+        timezone_setting = default_schedule.timezone
+        tz = resolve_timezone(timezone_setting)
 
-"""Unmute all chats that are muted until start_of_day next working day"""
-async def unmute_chats():
-    print("Starting unmute operation...")
+        next_working_day = default_schedule.get_next_working_day(timezone_setting)
+        start_of_day = default_schedule.start_of_day
 
-    if settings is None:
-        raise RuntimeError("Settings not loaded")
+        target_mute_until = pendulum.datetime(
+            next_working_day.year,
+            next_working_day.month,
+            next_working_day.day,
+            start_of_day.hour,
+            start_of_day.minute,
+            start_of_day.second,
+            tz=tz
+        )
 
-    # Connect to the Telegram API
-    client = TelegramClient('ru.aensidhe.console_groups_muter', settings.auth.api_id, settings.auth.api_hash)
-    await client.connect()
+        log.info(f"Looking for chats muted until: {target_mute_until}")
 
-    # Ensure you're authorized
-    if not await client.is_user_authorized():
-        await client.send_code_request(settings.auth.phone_number)
-        try:
-            await client.sign_in(settings.auth.phone_number, input('Enter the code: '))
-        except SessionPasswordNeededError:
-            await client.sign_in(settings.auth.phone_number, password=getpass('Enter 2FA password: '))
+        unmuted_count, failed_count = await unmute_dialogs(client, target_mute_until)
 
-    # Get default schedule for unmuting calculation
-    schedule_manager_instance = settings.get_schedule_manager()
-    default_schedule = schedule_manager_instance.get_effective_schedule('default')
+        log.info(f"Unmute operation completed. Total chats unmuted: {unmuted_count}")
+        if failed_count:
+            log.error(f"Failed to unmute {failed_count} chats")
+    finally:
+        # Disconnect from the Telegram API, also when the run gave up
+        await client.disconnect()
+    return failed_count
 
-    # Calculate the target mute_until time (start_of_day next working day)
-    timezone_setting = default_schedule.timezone
-    if timezone_setting == "auto":
-        tz = pendulum.local_timezone()
-    else:
-        tz = pendulum.timezone(timezone_setting)
+async def mute_dialog(client, dialog, peer, schedule_manager: ScheduleManager, finish_the_day: bool,
+                      semaphore: asyncio.Semaphore) -> bool:
+    """Mute a single dialog until start_of_day of its next working day, return True if it was muted"""
+    name = dialog.name
+    group_schedule = schedule_manager.get_schedule_for_group(name)
 
-    next_working_day = default_schedule.get_next_working_day(timezone_setting)
-    start_of_day = default_schedule.start_of_day
+    # Calculate the mute_until time for this specific group
+    timezone_setting = group_schedule.timezone
+    tz = resolve_timezone(timezone_setting)
 
-    target_mute_until = pendulum.datetime(
+    now = pendulum.now(tz)
+
+    if not finish_the_day and group_schedule.is_working_hours(now):
+        log.info(f"Skipping chat '{name}': {now} is working hours for this chat according to schedule.")
+        return False
+
+    next_working_day = group_schedule.get_next_working_day(timezone_setting, now)
+    start_of_day = group_schedule.start_of_day
+
+    mute_until = pendulum.datetime(
         next_working_day.year,
         next_working_day.month,
         next_working_day.day,
@@ -436,133 +335,70 @@ async def unmute_chats():
         tz=tz
     )
 
-    print(f"Looking for chats muted until: {target_mute_until}")
-
-    # Fetch all dialogs with pagination
-    all_dialogs = await handle_rate_limit(client.get_dialogs, limit=None)
-
-    unmuted_count = 0
-
-    # Iterate through all dialogs and unmute matching chats
-    for dialog in all_dialogs:
-        peer = await get_peer_for_dialog(dialog)
-
-        if peer is not None:
-            # Check if the group is muted until the target time
-            notify_settings = await handle_rate_limit(client, GetNotifySettingsRequest(peer=peer))
-
-            if (notify_settings and
-                notify_settings.mute_until and
-                notify_settings.mute_until == target_mute_until):
-
-                # Unmute the chat
-                unmute_settings = InputPeerNotifySettings(
-                    mute_until=None,
-                    show_previews=True
-                )
-                await handle_rate_limit(client, UpdateNotifySettingsRequest(
-                    peer=peer,
-                    settings=unmute_settings
-                ))
-                print(f"Unmuted chat: {dialog.name}")
-                unmuted_count += 1
-            else:
-                print(f"Skipped chat: {dialog.name} (not muted until target time)")
-        else:
-            if not isinstance(dialog.entity, User):
-                print(f"Skipped: {dialog.name}, unknown peer type")
+    log.info(f"Group '{name}' will be muted until: {mute_until}")
+    # Hold the semaphore for both requests, so FloodWait backoff throttles the whole pool
+    async with semaphore:
+        # Check if the group is already muted
+        notify_settings = await get_notify_settings(client, dialog, peer)
+        is_already_muted = (notify_settings and
+                            notify_settings.mute_until and
+                            notify_settings.mute_until > now)
+
+        if is_already_muted:
+            log.info(f"Skipping already muted chat: {name}")
+            return False
 
-    print(f"Unmute operation completed. Total chats unmuted: {unmuted_count}")
+        # Mute the group until start_of_day next day
+        await handle_rate_limit(client, UpdateNotifySettingsRequest(
+            peer=peer,
+            # Telethon sends dates as epoch ints anyway, so skip its per-request datetime conversion
+            settings=get_mute_settings(int(mute_until.timestamp()))
+        ))
+    log.info(f"Muted chat: {name}")
+    return True
+
+async def mute_dialogs(client, schedule_manager: ScheduleManager, finish_the_day: bool = False) -> Tuple[int, int]:
+    """Mute all group dialogs of a connected client by their schedules, return how many were muted and failed"""
+    # Mute dialogs concurrently, bounded so we don't flood Telegram with requests.
+    # Dialogs are streamed, so muting starts while next pages are still being fetched.
+    # Only groups get a task, other dialogs are filtered out while iterating.
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    results = await run_dialog_tasks(
+        get_group_dialogs(iter_dialogs(client)),
+        lambda dialog, peer: mute_dialog(client, dialog, peer, schedule_manager, finish_the_day, semaphore),
+        "muted"
+    )
 
-    # Disconnect from the Telegram API
-    await client.disconnect()
+    muted_count = 0
+    failed_count = 0
+    for dialog, result in results:
+        if isinstance(result, Exception):
+            log.warning(f"Failed to mute chat {dialog.name}: {result}")
+            failed_count += 1
+        elif result:
+            muted_count += 1
+    return muted_count, failed_count
 
 """Mute all unmuted chats until start_of_day next working day"""
 async def mute_chats(finish_the_day: bool = False):
     # Get appropriate schedule for this group
     if settings is None:
         raise RuntimeError("Settings not loaded")
-    print("Starting mute operation...")
-
-    # Connect to the Telegram API
-    client = TelegramClient('ru.aensidhe.console_groups_muter', settings.auth.api_id, settings.auth.api_hash)
-    await client.connect()
+    log.info("Starting mute operation...")
 
-    # Ensure you're authorized
-    if not await client.is_user_authorized():
-        await client.send_code_request(settings.auth.phone_number)
-        try:
-            await client.sign_in(settings.auth.phone_number, input('Enter the code: '))
-        except SessionPasswordNeededError:
-            await client.sign_in(settings.auth.phone_number, password=getpass('Enter 2FA password: '))
-
-    # Fetch all dialogs with pagination first
-    all_dialogs = await handle_rate_limit(client.get_dialogs, limit=None)
-
-    muted_count = 0
+    client = await connect_client()
 
-    # Iterate through all dialogs and mute unmuted groups
-    for dialog in all_dialogs:
-        schedule_manager_instance = settings.get_schedule_manager()
-        group_schedule = schedule_manager_instance.get_schedule_for_group(dialog.name)
-
-        # Calculate the mute_until time for this specific group
-        timezone_setting = group_schedule.timezone
-        if timezone_setting == "auto":
-            tz = pendulum.local_timezone()
-        else:
-            tz = pendulum.timezone(timezone_setting)
-
-        now = pendulum.now(tz)
+    try:
+        # Built once, its effective schedules are shared by all dialogs
+        muted_count, failed_count = await mute_dialogs(client, settings.get_schedule_manager(), finish_the_day)
 
-        next_working_day = group_schedule.get_next_working_day(timezone_setting)
-        start_of_day = group_schedule.start_of_day
-
-        mute_until = pendulum.datetime(
-            next_working_day.year,
-            next_working_day.month,
-            next_working_day.day,
-            start_of_day.hour,
-            start_of_day.minute,
-            start_of_day.second,
-            tz=tz
-        )
-
-        peer = await get_peer_for_dialog(dialog)
-
-        if peer is not None:
-            if not finish_the_day and group_schedule.is_working_hours(now):
-                print(f"Skipping chat '{dialog.name}': {now} is working hours for this chat according to schedule.")
-                continue
-            print(f"Group '{dialog.name}' will be muted until: {mute_until}")
-            # Check if the group is already muted
-            notify_settings = await handle_rate_limit(client, GetNotifySettingsRequest(peer=peer))
-            is_already_muted = (notify_settings and
-                                notify_settings.mute_until and
-                                notify_settings.mute_until > now)
-
-            if is_already_muted:
-                print(f"Skipping already muted chat: {dialog.name}")
-            else:
-                # Mute the group until start_of_day next day
-                mute_settings = InputPeerNotifySettings(
-                    mute_until=mute_until,
-                    show_previews=False
-                )
-                await handle_rate_limit(client, UpdateNotifySettingsRequest(
-                    peer=peer,
-                    settings=mute_settings
-                ))
-                print(f"Muted chat: {dialog.name}")
-                muted_count += 1
-        else:
-            if not isinstance(dialog.entity, User):
-                print(f"Skipped: {dialog.name}, unknown peer type")
-
-    print(f"Mute operation completed. Total chats muted: {muted_count}")
-
-    # Disconnect from the Telegram API
-    await client.disconnect()
+        log.info(f"Mute operation completed. Total chats muted: {muted_count}")
+        if failed_count:
+            log.error(f"Failed to mute {failed_count} chats")
+    finally:
+        # Disconnect from the Telegram API, also when the run gave up
+        await client.disconnect()
+    return failed_count
 
 async def main():
     parser = argparse.ArgumentParser(
@@ -583,17 +419,37 @@ async def main():
 
     args = parser.parse_args()
 
+    global settings
+    if settings is None:
+        settings = get_settings()
+
     if args.command == "mute":
-        await mute_chats(finish_the_day=args.finish_the_day)
+        failed_count = await mute_chats(finish_the_day=args.finish_the_day)
     elif args.command == "unmute":
-        await unmute_chats()
+        failed_count = await unmute_chats()
     else:
-        print(f"Unknown command: {args.command}")
+        log.error(f"Unknown command: {args.command}")
         return 1
 
-    return 0
+    # Failed chats are only logged, fail the run too so cron reports it
+    return 1 if failed_count else 0
+
+def setup_logging() -> QueueListener:
+    """Log to stdout through a queue, so coroutines never block on writing and flushing output"""
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    # Only our own progress is logged at INFO, libraries like telethon stay at WARNING
+    logging.basicConfig(handlers=[QueueHandler(log_queue)])
+    log.setLevel(logging.INFO)
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
 
 if __name__ == "__main__":
-    import sys
-    exit_code = asyncio.run(main())
+    listener = setup_logging()
+    try:
+        exit_code = asyncio.run(main())
+    finally:
+        listener.stop()
     sys.exit(exit_code or 0)
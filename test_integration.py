@@ -5,19 +5,84 @@
 import pytest
 import asyncio
 import pendulum
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch, MagicMock
+from telethon import TelegramClient
+from telethon.sessions import StringSession
 from telethon.errors.rpcerrorlist import FloodWaitError
-from telethon.tl.types import InputPeerNotifySettings, InputPeerChannel, Chat, InputPeerChat, User
+from telethon.tl.functions.account import GetNotifySettingsRequest, UpdateNotifySettingsRequest
+from telethon.tl.types import InputPeerNotifySettings, PeerNotifySettings, InputPeerChannel, Channel, Chat, ChatPhotoEmpty, InputPeerChat, User
 
-from telegram_muter import Schedule, Settings, AuthSettings, handle_rate_limit, main, mute_chats, unmute_chats, get_peer_for_dialog
+from telegram_muter import Schedule, Settings, AuthSettings, handle_rate_limit, main, mute_chats, mute_dialog, mute_dialogs, unmute_chats, get_peer_for_dialog, get_group_dialogs, get_mute_settings, get_settings, connect_client, iter_dialogs, AdaptiveTokenBucket, MAX_RETRIES, MAX_FLOOD_WAIT
+
+
+# Fixed moments around the mock_settings schedule: Friday 2025-09-05 is a vacation, Saturday 2025-09-06 is working
+THURSDAY_23 = pendulum.datetime(2025, 9, 4, 23, 0, 0)
+THURSDAY_19 = pendulum.datetime(2025, 9, 4, 19, 0, 0)
+THURSDAY_17 = pendulum.datetime(2025, 9, 4, 17, 0, 0)
+THURSDAY_14 = pendulum.datetime(2025, 9, 4, 14, 0, 0)
+THURSDAY_11 = pendulum.datetime(2025, 9, 4, 11, 0, 0)
+SAT_WORKING = pendulum.date(2025, 9, 6)
+TEN_AM = pendulum.time(10, 0, 0)
+
+
+def async_iter(items):
+    """Wrap items into an async iterator, as returned by TelegramClient.iter_dialogs"""
+    async def iterate():
+        for item in items:
+            yield item
+    return iterate()
+
+
+def channel(channel_id, access_hash, title, broadcast=False, left=False):
+    """Create a Channel entity, a megagroup unless broadcast is set"""
+    return Channel(id=channel_id, title=title, photo=ChatPhotoEmpty(), date=None, access_hash=access_hash,
+                   broadcast=broadcast, megagroup=not broadcast, left=left)
+
+
+def make_dialog(name, entity, input_entity=None):
+    """Create a dialog as returned by TelegramClient.iter_dialogs, without notify settings attached"""
+    return SimpleNamespace(name=name, entity=entity, input_entity=input_entity,
+                           dialog=SimpleNamespace(notify_settings=None))
+
+
+def rate_limit_dispatch(notify_settings=None):
+    """Build a handle_rate_limit side effect answering notify settings requests by type"""
+    async def dispatch(operation, *args, **kwargs):
+        request = args[0] if args else None
+        if isinstance(request, GetNotifySettingsRequest):
+            return notify_settings
+        if isinstance(request, UpdateNotifySettingsRequest):
+            return None
+        return await operation(*args, **kwargs)
+    return dispatch
+
+
+def sent_requests(mock_handle_rate_limit, request_type):
+    """Collect the requests of the given type (or tuple of types) passed to a mocked handle_rate_limit"""
+    return [call.args[1] for call in mock_handle_rate_limit.call_args_list
+            if len(call.args) > 1 and isinstance(call.args[1], request_type)]
 
 
 class TestTelegramIntegration:
     """Integration tests for Telegram API functionality with working days algorithm"""
 
-    @pytest.fixture
-    def mock_settings(self):
-        """Create mock settings for testing"""
+    @pytest.fixture(autouse=True)
+    def fresh_rate_limiter(self):
+        """Give every test its own full token bucket"""
+        with patch('telegram_muter.rate_limiter', AdaptiveTokenBucket()) as rate_limiter:
+            yield rate_limiter
+
+    @pytest.fixture(autouse=True)
+    def mock_sleep(self):
+        """Never really sleep, so rate limiter and backoff waits cost no wall time in any test"""
+        with patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            yield mock_sleep
+
+    @pytest.fixture(scope="class")
+    @classmethod
+    def mock_settings(cls):
+        """Create mock settings for testing, shared by the class since no test modifies them"""
         default_schedule = Schedule(
             name="default",
             start_of_day="10:00:00",
@@ -36,35 +101,76 @@ class TestTelegramIntegration:
             schedules=[default_schedule]
         )
 
+    @pytest.fixture(scope="class")
+    @classmethod
+    def target_mute_until(cls, mock_settings):
+        """Mute time the muting logic targets at THURSDAY_11"""
+        default_schedule = mock_settings.get_schedule_manager().get_effective_schedule('default')
+        next_working_day = default_schedule.get_next_working_day(now=THURSDAY_11)
+        start_of_day = default_schedule.start_of_day
+        return pendulum.datetime(
+            next_working_day.year,
+            next_working_day.month,
+            next_working_day.day,
+            start_of_day.hour,
+            start_of_day.minute,
+            start_of_day.second,
+            tz=pendulum.local_timezone()
+        )
+
+    @pytest.fixture
+    def frozen_now(self, monkeypatch):
+        """Freeze pendulum.now at the given moment"""
+        def freeze(moment):
+            monkeypatch.setattr(pendulum, 'now', lambda *args, **kwargs: moment)
+        return freeze
+
     @pytest.fixture
-    def mock_channel_dialog(self):
-        """Create mock channel dialog for testing"""
-        dialog = MagicMock()
-        dialog.name = "Test Channel"
-        dialog.entity.id = 123456789
-        dialog.entity.access_hash = 987654321
-        dialog.entity.broadcast = False  # It's a supergroup/channel, not a broadcast channel
-        return dialog
+    def mock_client(self):
+        """Patch TelegramClient with an authorized client mock, tests set up its dialogs"""
+        with patch('telegram_muter.TelegramClient') as mock_client_class:
+            # The spec keeps calls to methods TelegramClient does not have from passing silently
+            client = AsyncMock(spec=TelegramClient)
+            mock_client_class.return_value = client
+            client.connect.return_value = None
+            client.is_user_authorized.return_value = True
+            # disconnect is a plain method returning a coroutine, so the spec makes it synchronous
+            client.disconnect = AsyncMock(return_value=None)
+            yield client
 
     @pytest.fixture
-    def mock_chat_dialog(self):
-        """Create mock regular chat dialog for testing"""
-        dialog = MagicMock()
-        dialog.name = "Test Regular Chat"
-        # Use MagicMock for the entity to avoid constructor issues
-        dialog.entity = MagicMock(spec=Chat)
-        dialog.entity.id = 987654321
-        return dialog
+    def loaded_settings(self, mock_settings):
+        """Install mock_settings as the settings loaded by telegram_muter"""
+        with patch('telegram_muter.settings', mock_settings):
+            yield mock_settings
 
     @pytest.fixture
-    def mock_user_dialog(self):
-        """Create mock user dialog for testing"""
-        dialog = MagicMock()
-        dialog.name = "Test User"
-        # Use MagicMock for the entity to avoid constructor issues
-        dialog.entity = MagicMock(spec=User)
-        dialog.entity.id = 555666777
-        return dialog
+    def mock_handle_rate_limit(self):
+        """Patch handle_rate_limit, tests set up its side effect"""
+        with patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit:
+            yield mock_handle_rate_limit
+
+    @pytest.fixture(scope="class")
+    @classmethod
+    def mock_channel_dialog(cls):
+        """Create mock channel dialog for testing, shared by the class so tests must not modify it"""
+        # It's a supergroup/channel, not a broadcast channel
+        return make_dialog("Test Channel", channel(123456789, 987654321, "Test Channel"),
+                           InputPeerChannel(123456789, 987654321))
+
+    @pytest.fixture(scope="class")
+    @classmethod
+    def mock_chat_dialog(cls):
+        """Create mock regular chat dialog for testing, shared by the class so tests must not modify it"""
+        entity = Chat(id=987654321, title="Test Regular Chat", photo=ChatPhotoEmpty(),
+                      participants_count=3, date=None, version=1)
+        return make_dialog("Test Regular Chat", entity, InputPeerChat(entity.id))
+
+    @pytest.fixture(scope="class")
+    @classmethod
+    def mock_user_dialog(cls):
+        """Create mock user dialog for testing, shared by the class so tests must not modify it"""
+        return make_dialog("Test User", User(id=555666777, first_name="Test User"))
 
     @pytest.mark.asyncio
     async def test_handle_rate_limit_success(self):
@@ -77,323 +183,316 @@ class TestTelegramIntegration:
         mock_operation.assert_called_once_with("arg1", kwarg1="value1")
 
     @pytest.mark.asyncio
-    async def test_handle_rate_limit_with_flood_wait(self):
+    @pytest.mark.parametrize("seconds", [1, 60, MAX_FLOOD_WAIT])
+    async def test_handle_rate_limit_with_flood_wait(self, mock_sleep, seconds):
         """Test rate limiting handler with FloodWaitError"""
         mock_operation = AsyncMock()
-        # Create FloodWaitError with specific seconds
-        flood_error = FloodWaitError("FLOOD_WAIT_1")
-        flood_error.seconds = 1  # Manually set the seconds attribute
+        # Telethon parses the wait time out of the error message into capture
+        flood_error = FloodWaitError(request=None, capture=seconds)
         mock_operation.side_effect = [
             flood_error,  # First call raises error
             "success"  # Second call succeeds
         ]
 
-        with patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
-            result = await handle_rate_limit(mock_operation)
+        # Sleep is mocked, so long waits cost no wall time
+        result = await handle_rate_limit(mock_operation)
 
         assert result == "success"
         assert mock_operation.call_count == 2
-        mock_sleep.assert_called_once_with(1)
+        mock_sleep.assert_called_once_with(seconds)
 
     @pytest.mark.asyncio
-    async def test_mute_calculation_with_working_days(self, mock_settings):
-        """Test that mute_until calculation uses working days algorithm correctly"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('sys.argv', ['telegram_muter.py', 'mute']):
-
-            # Mock current time: Thursday 11:00 PM (after start_of_day)
-            mock_time = pendulum.parse("2025-09-04T23:00:00")
-            mock_now.return_value = mock_time
+    @pytest.mark.parametrize("seconds", [MAX_FLOOD_WAIT + 1, 1267, 77264])
+    async def test_handle_rate_limit_gives_up_on_long_flood_wait(self, mock_sleep, seconds):
+        """Test that a FloodWaitError longer than MAX_FLOOD_WAIT is raised instead of waited out"""
+        flood_error = FloodWaitError(request=None, capture=seconds)
+        mock_operation = AsyncMock(side_effect=flood_error)
 
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = []  # No dialogs to avoid muting logic
-            mock_client.disconnect.return_value = None
-
-            await main()
-
-            # Verify the correct next working day calculation
-            # Starting day would be Friday (after start_of_day), but Friday is vacation
-            # Saturday is weekend but marked as working, so mute_until should be Saturday 10:00
-            expected_date = pendulum.parse("2025-09-06").date()
-            expected_time = pendulum.parse("10:00:00").time()
-            expected_mute_until = pendulum.datetime(
-                expected_date.year,
-                expected_date.month,
-                expected_date.day,
-                expected_time.hour,
-                expected_time.minute,
-                expected_time.second,
-                tz=pendulum.local_timezone()
-            )
+        with patch('telegram_muter.log'):
+            with pytest.raises(FloodWaitError):
+                await handle_rate_limit(mock_operation)
 
-            # We can't directly assert the mute_until value, but we verified the algorithm
-            # in previous tests. Here we just ensure the main function runs without error.
+        mock_operation.assert_called_once()
+        mock_sleep.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_mute_unmuted_channel(self, mock_settings, mock_channel_dialog):
-        """Test muting an unmuted channel"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('sys.argv', ['telegram_muter.py', 'mute']):
+    async def test_handle_rate_limit_retries_network_errors(self, mock_sleep):
+        """Test that network errors are retried with growing delays until MAX_RETRIES is reached"""
+        mock_operation = AsyncMock(side_effect=ConnectionError("connection reset"))
 
-            # Mock current time - outside working hours (after 18:00)
-            mock_time = pendulum.parse("2025-09-04T19:00:00")  # Thursday after end_of_day
-            mock_now.return_value = mock_time
-
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
+        with patch('telegram_muter.log'):
+            with pytest.raises(ConnectionError):
+                await handle_rate_limit(mock_operation)
 
-            # Mock notify settings (group is not muted)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = None
-
-            # Configure handle_rate_limit to return appropriate values
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if hasattr(operation, '__name__') and operation.__name__ == 'get_dialogs':
-                    return [mock_channel_dialog]
-                elif 'GetNotifySettingsRequest' in str(args) if args else False:
-                    return mock_notify_settings
-                elif 'UpdateNotifySettingsRequest' in str(args) if args else False:
-                    return None
-                return await operation(*args, **kwargs)
-
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
-
-            await main()
-
-            # Verify that handle_rate_limit was called for both get and update operations
-            assert mock_handle_rate_limit.call_count >= 2
+        assert mock_operation.call_count == MAX_RETRIES
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        assert len(delays) == MAX_RETRIES - 1
+        assert delays == sorted(delays)
+        assert all(delay <= MAX_FLOOD_WAIT for delay in delays)
 
     @pytest.mark.asyncio
-    async def test_skip_already_muted_channel(self, mock_settings, mock_channel_dialog):
-        """Test skipping already muted channel"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('sys.argv', ['telegram_muter.py', 'mute']):
-
-            # Mock current time
-            mock_time = pendulum.parse("2025-09-04T11:00:00")
-            mock_now.return_value = mock_time
+    async def test_token_bucket_waits_when_empty(self, mock_sleep):
+        """Test that the token bucket lets a burst through and then spaces requests by its rate"""
+        bucket = AdaptiveTokenBucket(rate=2.0, capacity=2)
 
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
+        await bucket.acquire()
+        await bucket.acquire()
+        mock_sleep.assert_not_called()
 
-            # Mock notify settings (group is already muted until future)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = mock_time.add(days=1)  # Muted until tomorrow
+        await bucket.acquire()
+        mock_sleep.assert_called_once()
+        assert mock_sleep.call_args.args[0] == pytest.approx(0.5, abs=0.05)
 
-            # Configure handle_rate_limit
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if operation == mock_client.get_dialogs:
-                    return [mock_channel_dialog]
-                elif operation == mock_client:  # This is the GetNotifySettingsRequest call
-                    return mock_notify_settings
-                return await operation(*args, **kwargs)
-
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
+    @pytest.mark.asyncio
+    async def test_handle_rate_limit_adapts_rate(self, fresh_rate_limiter):
+        """Test that successes raise the request rate and FloodWaitError lowers it"""
+        flood_error = FloodWaitError(request=None, capture=1)
+        mock_operation = AsyncMock(side_effect=[flood_error, "success"])
+        initial_rate = fresh_rate_limiter.rate
 
-            await main()
+        with patch('telegram_muter.log'):
+            await handle_rate_limit(mock_operation)
 
-            # Should not call UpdateNotifySettingsRequest since group is already muted
-            update_calls = [call for call in mock_handle_rate_limit.call_args_list
-                          if 'UpdateNotifySettingsRequest' in str(call)]
-            assert len(update_calls) == 0
+        assert fresh_rate_limiter.rate == pytest.approx(initial_rate * 0.5 + 1.0)
 
     @pytest.mark.asyncio
-    async def test_mute_unmuted_regular_chat(self, mock_settings, mock_chat_dialog):
-        """Test muting an unmuted regular chat"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('sys.argv', ['telegram_muter.py', 'mute']):
-
-            # Mock current time - outside working hours (after 18:00)
-            mock_time = pendulum.parse("2025-09-04T19:00:00")  # Thursday after end_of_day
-            mock_now.return_value = mock_time
+    async def test_mute_calculation_with_working_days(self, frozen_now, mock_client, mock_settings, mock_handle_rate_limit, mock_channel_dialog):
+        """Test that mute_until calculation uses working days algorithm correctly"""
+        # Mock current time: Thursday 11:00 PM (after start_of_day)
+        frozen_now(THURSDAY_23)
+
+        mock_client.iter_dialogs = MagicMock(return_value=async_iter([mock_channel_dialog]))
+        mock_handle_rate_limit.side_effect = rate_limit_dispatch(SimpleNamespace(mute_until=None))
+
+        with patch('telegram_muter.log'):
+            await mute_dialogs(mock_client, mock_settings.get_schedule_manager())
+
+        # Starting day would be Friday (after start_of_day), but Friday is vacation
+        # Saturday is weekend but marked as working, so mute_until should be Saturday 10:00
+        expected_mute_until = pendulum.datetime(
+            SAT_WORKING.year,
+            SAT_WORKING.month,
+            SAT_WORKING.day,
+            TEN_AM.hour,
+            TEN_AM.minute,
+            TEN_AM.second,
+            tz=pendulum.local_timezone()
+        )
+        update_calls = sent_requests(mock_handle_rate_limit, UpdateNotifySettingsRequest)
+        assert len(update_calls) == 1
+        assert update_calls[0].settings.mute_until == int(expected_mute_until.timestamp())
 
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_chat_dialog]
-            mock_client.disconnect.return_value = None
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("now, finish_the_day, dialog_fixture, should_mute", [
+        (THURSDAY_19, False, 'mock_channel_dialog', True),
+        (THURSDAY_19, False, 'mock_chat_dialog', True),
+        (THURSDAY_14, False, 'mock_channel_dialog', False),
+        (THURSDAY_14, True, 'mock_channel_dialog', True),
+        (THURSDAY_17, False, 'mock_channel_dialog', False),
+        (THURSDAY_17, True, 'mock_channel_dialog', True),
+    ], ids=[
+        "channel-after-end-of-day",
+        "chat-after-end-of-day",
+        "working-hours",
+        "working-hours-finish-the-day",
+        "before-end-of-day",
+        "before-end-of-day-finish-the-day",
+    ])
+    async def test_mute_flow(self, frozen_now, request, mock_client, mock_settings, mock_handle_rate_limit, now, finish_the_day, dialog_fixture, should_mute):
+        """Test that an unmuted chat is muted only outside working hours or with --finish-the-day"""
+        dialog = request.getfixturevalue(dialog_fixture)
+        frozen_now(now)
+        with patch('telegram_muter.log') as mock_log:
+
+            mock_client.iter_dialogs = MagicMock(return_value=async_iter([dialog]))
 
             # Mock notify settings (group is not muted)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = None
-
-            # Configure handle_rate_limit to return appropriate values
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if hasattr(operation, '__name__') and operation.__name__ == 'get_dialogs':
-                    return [mock_chat_dialog]
-                elif 'GetNotifySettingsRequest' in str(args) if args else False:
-                    return mock_notify_settings
-                elif 'UpdateNotifySettingsRequest' in str(args) if args else False:
-                    return None
-                return await operation(*args, **kwargs)
-
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
-
-            await main()
-
-            # Verify that handle_rate_limit was called for both get and update operations
-            assert mock_handle_rate_limit.call_count >= 2
+            mock_notify_settings = SimpleNamespace(mute_until=None)
+            mock_handle_rate_limit.side_effect = rate_limit_dispatch(mock_notify_settings)
+
+            # The connected client is passed in, connecting and argv parsing are covered by other tests
+            muted_count, failed_count = await mute_dialogs(mock_client, mock_settings.get_schedule_manager(), finish_the_day)
+
+            assert muted_count == (1 if should_mute else 0)
+            assert failed_count == 0
+            update_calls = sent_requests(mock_handle_rate_limit, UpdateNotifySettingsRequest)
+            skip_count = sum(1 for call in mock_log.info.call_args_list
+                             if call.args and isinstance(call.args[0], str)
+                             and call.args[0].startswith(f"Skipping chat '{dialog.name}'")
+                             and call.args[0].endswith("is working hours for this chat according to schedule."))
+            if should_mute:
+                assert len(update_calls) == 1
+                assert skip_count == 0
+            else:
+                # Skipped before notify settings are even read
+                assert mock_handle_rate_limit.call_count == 0
+                assert skip_count == 1
 
     @pytest.mark.asyncio
-    async def test_working_hours_protection(self, mock_settings, mock_channel_dialog):
-        """Test that muting is blocked during working hours without --finish-the-day flag"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('sys.argv', ['telegram_muter.py', 'mute']):
+    async def test_mute_continues_after_failed_chat(self, frozen_now, mock_client, loaded_settings, mock_handle_rate_limit, mock_channel_dialog):
+        """Test that a failure to mute one chat does not stop muting of the others"""
+        failing_dialog = make_dialog("Failing Channel", channel(111111111, 222222222, "Failing Channel"),
+                                     InputPeerChannel(111111111, 222222222))
 
-            # Mock current time - during working hours (between 10:00 and 18:00)
-            mock_time = pendulum.parse("2025-09-04T14:00:00")  # Thursday 2 PM
-            mock_now.return_value = mock_time
+        with patch('telegram_muter.log') as mock_log:
 
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
+            # Mock current time - outside working hours (after 18:00)
+            mock_time = THURSDAY_19  # Thursday after end_of_day
+            frozen_now(mock_time)
 
-            # Mock notify settings (group is not muted)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = None
+            mock_client.iter_dialogs = MagicMock(return_value=async_iter([failing_dialog, mock_channel_dialog]))
+
+            # Mock notify settings (groups are not muted)
+            mock_notify_settings = SimpleNamespace(mute_until=None)
 
-            # Configure handle_rate_limit to return appropriate values
             async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if hasattr(operation, '__name__') and operation.__name__ == 'get_dialogs':
-                    return [mock_channel_dialog]
-                elif 'GetNotifySettingsRequest' in str(args) if args else False:
+                if isinstance(args[0], GetNotifySettingsRequest):
+                    if args[0].peer.channel_id == failing_dialog.entity.id:
+                        raise RuntimeError("connection lost")
                     return mock_notify_settings
-                elif 'UpdateNotifySettingsRequest' in str(args) if args else False:
-                    return None
-                return await operation(*args, **kwargs)
+                return None
 
             mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
 
-            await main()
+            failed_count = await mute_chats()
+
+            update_calls = sent_requests(mock_handle_rate_limit, UpdateNotifySettingsRequest)
+            assert len(update_calls) == 1
+            assert update_calls[0].peer.channel_id == mock_channel_dialog.entity.id
 
-            # Should connect, but not proceed with muting despite working hours
+            assert failed_count == 1
+            mock_log.warning.assert_any_call("Failed to mute chat Failing Channel: connection lost")
+            mock_log.info.assert_any_call("Mute operation completed. Total chats muted: 1")
+            mock_log.error.assert_called_once_with("Failed to mute 1 chats")
             mock_client.connect.assert_called_once()
-            assert mock_handle_rate_limit.call_count == 1
+            mock_client.disconnect.assert_called_once()
 
     @pytest.mark.asyncio
-    async def test_finish_the_day_flag(self, mock_settings, mock_channel_dialog):
-        """Test that --finish-the-day flag allows muting during working hours"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('sys.argv', ['telegram_muter.py', 'mute', '--finish-the-day']):
+    async def test_mute_stops_on_long_flood_wait(self, frozen_now, mock_client, loaded_settings, mock_handle_rate_limit):
+        """Test that a FloodWait handle_rate_limit gave up on cancels the remaining chats instead of sending them into the ban"""
+        dialogs = [make_dialog(f"Channel {i}", channel(i, i, f"Channel {i}"), InputPeerChannel(i, i))
+                   for i in range(1, 51)]
+        frozen_now(THURSDAY_19)
+        mock_client.iter_dialogs = MagicMock(return_value=async_iter(dialogs))
+
+        async def handle_rate_limit_side_effect(operation, *args, **kwargs):
+            # The first chat is muted, then the account gets banned for an hour
+            if isinstance(args[0], UpdateNotifySettingsRequest) and args[0].peer.channel_id != 1:
+                raise FloodWaitError(request=None, capture=3600)
+            return SimpleNamespace(mute_until=None)
+
+        mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
+
+        with patch('telegram_muter.log') as mock_log:
+            with pytest.raises(FloodWaitError):
+                await mute_chats()
+
+        assert len(sent_requests(mock_handle_rate_limit, UpdateNotifySettingsRequest)) == 2
+        mock_log.error.assert_called_once_with(
+            "Rate limited by Telegram for 3600 seconds, giving up. Chats muted before that: 1"
+        )
+        mock_client.disconnect.assert_called_once()
 
-            # Mock current time - during working hours (between 10:00 and 18:00)
-            mock_time = pendulum.parse("2025-09-04T14:00:00")  # Thursday 2 PM
-            mock_now.return_value = mock_time
+    @pytest.mark.asyncio
+    async def test_mute_stops_on_long_flood_wait_while_paging(self, frozen_now, mock_client, mock_settings, mock_handle_rate_limit, mock_channel_dialog):
+        """Test that a FloodWait while fetching the next page of dialogs fails the run the same way"""
+        flood_error = FloodWaitError(request=None, capture=3600)
+        # Telethon's dialog iterator can be asked again after a failed page, unlike an async generator
+        dialogs = SimpleNamespace(__anext__=AsyncMock(side_effect=[mock_channel_dialog, flood_error, flood_error]))
+
+        frozen_now(THURSDAY_19)
+        mock_client.iter_dialogs = MagicMock(return_value=dialogs)
+        mock_handle_rate_limit.side_effect = rate_limit_dispatch(SimpleNamespace(mute_until=None))
+
+        with patch('telegram_muter.log') as mock_log:
+            with pytest.raises(FloodWaitError):
+                await mute_dialogs(mock_client, mock_settings.get_schedule_manager())
+
+        # The chat from the first page had no chance to run before the ban, so it is not sent into it either
+        assert sent_requests(mock_handle_rate_limit, UpdateNotifySettingsRequest) == []
+        mock_log.error.assert_called_once_with(
+            "Rate limited by Telegram for 3600 seconds, giving up. Chats muted before that: 0"
+        )
 
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
+    @pytest.mark.asyncio
+    async def test_skip_already_muted_channel(self, frozen_now, mock_client, loaded_settings, mock_handle_rate_limit, mock_channel_dialog):
+        """Test skipping already muted channel"""
+        # Mock current time
+        mock_time = THURSDAY_11
+        frozen_now(mock_time)
 
-            # Mock notify settings (group is not muted)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = None
+        mock_client.iter_dialogs = MagicMock(return_value=async_iter([mock_channel_dialog]))
 
-            # Configure handle_rate_limit to return appropriate values
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if hasattr(operation, '__name__') and operation.__name__ == 'get_dialogs':
-                    return [mock_channel_dialog]
-                elif 'GetNotifySettingsRequest' in str(args) if args else False:
-                    return mock_notify_settings
-                elif 'UpdateNotifySettingsRequest' in str(args) if args else False:
-                    return None
-                return await operation(*args, **kwargs)
+        # Mock notify settings (group is already muted until future)
+        mock_notify_settings = SimpleNamespace(mute_until=mock_time.add(days=1))  # Muted until tomorrow
 
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
+        mock_handle_rate_limit.side_effect = rate_limit_dispatch(mock_notify_settings)
 
-            await main()
+        await mute_chats()
 
-            # Should connect and proceed with muting despite working hours
-            mock_client.connect.assert_called_once()
-            assert mock_handle_rate_limit.call_count >= 2
+        # Should not call UpdateNotifySettingsRequest since group is already muted
+        update_calls = sent_requests(mock_handle_rate_limit, UpdateNotifySettingsRequest)
+        assert len(update_calls) == 0
 
     @pytest.mark.asyncio
-    async def test_skip_user_dialog(self, mock_settings, mock_user_dialog):
+    async def test_skip_user_dialog(self, frozen_now, mock_client, loaded_settings, mock_handle_rate_limit, mock_user_dialog):
         """Test skipping user dialogs (private chats)"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('builtins.print') as mock_print, \
-             patch('sys.argv', ['telegram_muter.py', 'mute']):
+        with patch('telegram_muter.log') as mock_log:
 
             # Mock current time
-            mock_time = pendulum.parse("2025-09-04T11:00:00")
-            mock_now.return_value = mock_time
+            mock_time = THURSDAY_11
+            frozen_now(mock_time)
 
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_user_dialog]
-            mock_client.disconnect.return_value = None
+            mock_client.iter_dialogs = MagicMock(return_value=async_iter([mock_user_dialog]))
 
-            # Configure handle_rate_limit
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if operation == mock_client.get_dialogs:
-                    return [mock_user_dialog]
-                return await operation(*args, **kwargs)
-
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
+            mock_handle_rate_limit.side_effect = rate_limit_dispatch()
 
-            await main()
+            await mute_chats()
 
             # Should not call any notification settings requests for users
-            get_notify_calls = [call for call in mock_handle_rate_limit.call_args_list
-                              if 'GetNotifySettingsRequest' in str(call)]
-            update_calls = [call for call in mock_handle_rate_limit.call_args_list
-                          if 'UpdateNotifySettingsRequest' in str(call)]
-
-            assert len(get_notify_calls) == 0
-            assert len(update_calls) == 0
+            assert sent_requests(mock_handle_rate_limit, (GetNotifySettingsRequest, UpdateNotifySettingsRequest)) == []
 
             # Should not print any skip message for user dialogs (they are silently ignored)
-            skip_calls = [call for call in mock_print.call_args_list
-                         if len(call.args) > 0 and 'Skipped' in str(call.args[0])]
-            assert len(skip_calls) == 0
+            assert not any(call.args and isinstance(call.args[0], str) and call.args[0].startswith("Skipped")
+                           for call in mock_log.info.call_args_list)
+
+    @pytest.mark.asyncio
+    async def test_get_group_dialogs(self, mock_channel_dialog, mock_chat_dialog, mock_user_dialog):
+        """Test that only groups we are in are yielded, with their peers, and other skips are reported"""
+        broadcast_dialog = make_dialog("Broadcast Channel", channel(121212121, 343434343, "Broadcast Channel", broadcast=True))
+        left_dialog = make_dialog("Left Group", channel(333333333, 444444444, "Left Group", left=True))
+
+        dialogs = async_iter([mock_channel_dialog, broadcast_dialog, left_dialog, mock_user_dialog, mock_chat_dialog])
+        with patch('telegram_muter.log') as mock_log:
+            targets = [target async for target in get_group_dialogs(dialogs)]
+
+        assert targets == [
+            (mock_channel_dialog, mock_channel_dialog.input_entity),
+            (mock_chat_dialog, mock_chat_dialog.input_entity)
+        ]
+        assert [call.args[0] for call in mock_log.info.call_args_list] == [
+            "Skipped: Broadcast Channel, unknown peer type",
+            "Skipped: Left Group, not a member"
+        ]
 
     @pytest.mark.asyncio
-    async def test_timezone_handling(self):
+    async def test_skip_already_muted_from_dialog_list(self, frozen_now, mock_settings, mock_handle_rate_limit, mock_channel_dialog):
+        """Test that notify settings sent with the dialog list are used instead of requesting them"""
+        notify_settings = PeerNotifySettings(mute_until=pendulum.datetime(2025, 9, 8, 10, 0, 0))
+
+        with patch.object(mock_channel_dialog.dialog, 'notify_settings', notify_settings), \
+             patch('telegram_muter.log'):
+            frozen_now(THURSDAY_19)
+
+            result = await mute_dialog(
+                AsyncMock(), mock_channel_dialog, mock_channel_dialog.input_entity,
+                mock_settings.get_schedule_manager(), False, asyncio.Semaphore(1)
+            )
+
+        assert result is False
+        mock_handle_rate_limit.assert_not_called()
+
+    def test_timezone_handling(self):
         """Test timezone handling in working day calculation"""
         schedule = Schedule(
             name="test",
@@ -412,29 +511,19 @@ class TestTelegramIntegration:
         next_working_day = schedule.get_next_working_day("auto")
         assert isinstance(next_working_day, pendulum.Date)
 
-    def test_input_peer_channel_creation(self, mock_channel_dialog):
-        """Test InputPeerChannel creation from dialog"""
-        peer = InputPeerChannel(mock_channel_dialog.entity.id, mock_channel_dialog.entity.access_hash)
-        assert peer.channel_id == mock_channel_dialog.entity.id
-        assert peer.access_hash == mock_channel_dialog.entity.access_hash
-
-    def test_input_peer_chat_creation(self, mock_chat_dialog):
-        """Test InputPeerChat creation from dialog"""
-        peer = InputPeerChat(mock_chat_dialog.entity.id)
-        assert peer.chat_id == mock_chat_dialog.entity.id
-
-    def test_input_peer_notify_settings_creation(self):
-        """Test InputPeerNotifySettings creation"""
-        mute_until = pendulum.now().add(days=1)
-        settings = InputPeerNotifySettings(
-            mute_until=mute_until,
-            show_previews=False
-        )
+    def test_get_mute_settings_shared(self):
+        """Test that chats muted until the same time share notify settings"""
+        mute_until = int(pendulum.datetime(2025, 9, 8, 10, 0, 0).timestamp())
+        settings = get_mute_settings(mute_until)
         assert settings.mute_until == mute_until
         assert settings.show_previews is False
+        assert get_mute_settings(int(pendulum.datetime(2025, 9, 8, 10, 0, 0).timestamp())) is settings
+        # Telethon serializes the timestamp as is
+        assert settings._bytes() == InputPeerNotifySettings(
+            mute_until=pendulum.datetime(2025, 9, 8, 10, 0, 0), show_previews=False
+        )._bytes()
 
-    @pytest.mark.asyncio
-    async def test_complex_working_day_scenario_integration(self):
+    def test_complex_working_day_scenario_integration(self):
         """Test complex working day scenario in integration context"""
         schedule = Schedule(
             name="test",
@@ -447,7 +536,7 @@ class TestTelegramIntegration:
 
         with patch('pendulum.now') as mock_now:
             # Mock Friday evening after work
-            mock_time = pendulum.parse("2025-12-26T19:00:00")  # Friday
+            mock_time = pendulum.datetime(2025, 12, 26, 19, 0, 0)  # Friday
             mock_now.return_value = mock_time
 
             next_working_day = schedule.get_next_working_day()
@@ -457,133 +546,113 @@ class TestTelegramIntegration:
             # - Sunday (2025-12-28) is weekend but in working_weekends
             # Wait, let me fix this - Saturday is 2025-12-27, Sunday is 2025-12-28
             # So next working day should be the working Saturday 2025-12-28
-            expected = pendulum.parse("2025-12-28").date()
+            expected = pendulum.date(2025, 12, 28)
             assert next_working_day == expected
 
-    @pytest.mark.asyncio
-    async def test_get_peer_for_dialog_chat(self, mock_chat_dialog):
-        """Test get_peer_for_dialog with Chat entity"""
-        peer = await get_peer_for_dialog(mock_chat_dialog)
-        assert isinstance(peer, InputPeerChat)
-        assert peer.chat_id == mock_chat_dialog.entity.id
-
-    @pytest.mark.asyncio
-    async def test_get_peer_for_dialog_channel(self, mock_channel_dialog):
-        """Test get_peer_for_dialog with Channel entity"""
-        peer = await get_peer_for_dialog(mock_channel_dialog)
-        assert isinstance(peer, InputPeerChannel)
-        assert peer.channel_id == mock_channel_dialog.entity.id
-        assert peer.access_hash == mock_channel_dialog.entity.access_hash
-
-    @pytest.mark.asyncio
-    async def test_get_peer_for_dialog_user(self, mock_user_dialog):
-        """Test get_peer_for_dialog with User entity"""
-        peer = await get_peer_for_dialog(mock_user_dialog)
-        assert peer is None
+    @pytest.mark.parametrize("dialog_fixture, peer_type, id_attr", [
+        ('mock_chat_dialog', InputPeerChat, 'chat_id'),
+        ('mock_channel_dialog', InputPeerChannel, 'channel_id'),
+        ('mock_user_dialog', type(None), None),
+    ], ids=["chat", "channel", "user"])
+    def test_get_peer_for_dialog(self, request, dialog_fixture, peer_type, id_attr):
+        """Test get_peer_for_dialog returns the dialog's input peer for groups and nothing for users"""
+        dialog = request.getfixturevalue(dialog_fixture)
+        peer = get_peer_for_dialog(dialog)
+        assert isinstance(peer, peer_type)
+        if id_attr:
+            assert peer is dialog.input_entity
+            assert getattr(peer, id_attr) == dialog.entity.id
 
     @pytest.mark.asyncio
-    async def test_unmute_matching_chats(self, mock_settings, mock_channel_dialog):
+    async def test_unmute_matching_chats(self, frozen_now, mock_client, loaded_settings, mock_handle_rate_limit, mock_channel_dialog, target_mute_until):
         """Test unmuting chats that are muted until target time"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit:
+        # Mock current time
+        mock_time = THURSDAY_11
+        frozen_now(mock_time)
 
-            # Mock current time
-            mock_time = pendulum.parse("2025-09-04T11:00:00")
-            mock_now.return_value = mock_time
+        mock_client.iter_dialogs = MagicMock(return_value=async_iter([mock_channel_dialog]))
 
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
-
-            # Calculate expected target mute time (same as the muting logic)
-            schedule_manager_instance = mock_settings.get_schedule_manager()
-            default_schedule = schedule_manager_instance.get_effective_schedule('default')
-            next_working_day = default_schedule.get_next_working_day()
-            start_of_day = default_schedule.start_of_day
-            target_mute_until = pendulum.datetime(
-                next_working_day.year,
-                next_working_day.month,
-                next_working_day.day,
-                start_of_day.hour,
-                start_of_day.minute,
-                start_of_day.second,
-                tz=pendulum.local_timezone()
-            )
+        # Mock notify settings (chat is muted until target time)
+        mock_notify_settings = SimpleNamespace(mute_until=target_mute_until)
 
-            # Mock notify settings (chat is muted until target time)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = target_mute_until
+        mock_handle_rate_limit.side_effect = rate_limit_dispatch(mock_notify_settings)
 
-            # Configure handle_rate_limit
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if operation == mock_client.get_dialogs:
-                    return [mock_channel_dialog]
-                elif 'GetNotifySettingsRequest' in str(args) if args else False:
-                    return mock_notify_settings
-                elif 'UpdateNotifySettingsRequest' in str(args) if args else False:
-                    return None
-                return await operation(*args, **kwargs)
+        await unmute_chats()
 
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
-
-            await unmute_chats()
-
-            # Should call UpdateNotifySettingsRequest to unmute
-            update_calls = [call for call in mock_handle_rate_limit.call_args_list
-                          if 'UpdateNotifySettingsRequest' in str(call)]
-            assert len(update_calls) == 1
+        # Should call UpdateNotifySettingsRequest to unmute
+        update_calls = sent_requests(mock_handle_rate_limit, UpdateNotifySettingsRequest)
+        assert len(update_calls) == 1
 
     @pytest.mark.asyncio
-    async def test_unmute_skip_non_matching_chats(self, mock_settings, mock_channel_dialog):
+    async def test_unmute_skip_non_matching_chats(self, frozen_now, mock_client, loaded_settings, mock_handle_rate_limit, mock_channel_dialog):
         """Test unmuting skips chats that are not muted until target time"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit:
+        # Mock current time
+        mock_time = THURSDAY_11
+        frozen_now(mock_time)
 
-            # Mock current time
-            mock_time = pendulum.parse("2025-09-04T11:00:00")
-            mock_now.return_value = mock_time
+        mock_client.iter_dialogs = MagicMock(return_value=async_iter([mock_channel_dialog]))
 
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
+        # Mock notify settings (chat is muted until different time)
+        mock_notify_settings = SimpleNamespace(mute_until=mock_time.add(hours=2))  # Different mute time
 
-            # Mock notify settings (chat is muted until different time)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = mock_time.add(hours=2)  # Different mute time
+        mock_handle_rate_limit.side_effect = rate_limit_dispatch(mock_notify_settings)
 
-            # Configure handle_rate_limit
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if operation == mock_client.get_dialogs:
-                    return [mock_channel_dialog]
-                elif 'GetNotifySettingsRequest' in str(args) if args else False:
-                    return mock_notify_settings
-                return await operation(*args, **kwargs)
+        await unmute_chats()
 
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
+        # Should not call UpdateNotifySettingsRequest
+        update_calls = sent_requests(mock_handle_rate_limit, UpdateNotifySettingsRequest)
+        assert len(update_calls) == 0
 
-            await unmute_chats()
+    @pytest.mark.asyncio
+    async def test_client_flood_wait_reaches_handle_rate_limit(self, mock_sleep, fresh_rate_limiter, loaded_settings):
+        """Test that a connected client raises FloodWaitError to handle_rate_limit instead of sleeping through it"""
+        client = TelegramClient(StringSession(), 12345, "test_hash")
+        notify_settings = PeerNotifySettings()
+        # Replies the sender gets from Telegram, the real client handles them
+        replies = AsyncMock(side_effect=[FloodWaitError(request=None, capture=30), notify_settings])
+        sender = MagicMock()
+        sender.send.side_effect = lambda request, ordered=False: replies()
+        client._sender = sender
+        initial_rate = fresh_rate_limiter.rate
+        # Telethon remembers when the wait is over, so mocked sleeps have to move its clock
+        clock = SimpleNamespace(now=1_000_000.0)
+        mock_sleep.side_effect = lambda seconds: setattr(clock, 'now', clock.now + seconds)
+
+        with patch('telegram_muter.TelegramClient', return_value=client), \
+             patch('telethon.client.users.time', SimpleNamespace(time=lambda: clock.now)), \
+             patch.object(client, 'connect', new_callable=AsyncMock), \
+             patch.object(client, 'is_user_authorized', new_callable=AsyncMock, return_value=True), \
+             patch('telegram_muter.log') as mock_log:
+            connected = await connect_client()
+            result = await handle_rate_limit(connected, GetNotifySettingsRequest(peer=InputPeerChannel(123456789, 987654321)))
+
+        assert result is notify_settings
+        assert sender.send.call_count == 2
+        mock_sleep.assert_any_call(30)
+        mock_log.warning.assert_called_once_with("Rate limited by Telegram. Waiting 30 seconds...")
+        assert fresh_rate_limiter.rate == pytest.approx(initial_rate * 0.5 + 1.0)
 
-            # Should not call UpdateNotifySettingsRequest
-            update_calls = [call for call in mock_handle_rate_limit.call_args_list
-                          if 'UpdateNotifySettingsRequest' in str(call)]
-            assert len(update_calls) == 0
+    @pytest.mark.asyncio
+    async def test_iter_dialogs_retries_failed_page(self, mock_sleep, mock_channel_dialog):
+        """Test that a page request failing with FloodWaitError is waited out and requested again"""
+        flood_error = FloodWaitError(request=None, capture=30)
+        dialogs = SimpleNamespace(__anext__=AsyncMock(side_effect=[flood_error, flood_error, mock_channel_dialog, StopAsyncIteration()]))
+        client = SimpleNamespace(iter_dialogs=MagicMock(return_value=dialogs))
+
+        with patch('telegram_muter.log'):
+            result = [dialog async for dialog in iter_dialogs(client)]
+
+        assert result == [mock_channel_dialog]
+        mock_sleep.assert_any_call(30)
+
+    def test_get_settings_without_config(self, tmp_path):
+        """Test that a missing config file leaves settings unloaded"""
+        assert get_settings(str(tmp_path / "config.toml")) is None
 
     @pytest.mark.asyncio
-    async def test_main_with_mute_command(self, mock_settings):
+    async def test_main_with_mute_command(self, loaded_settings):
         """Test main function with mute command"""
-        with patch('telegram_muter.mute_chats', new_callable=AsyncMock) as mock_mute_chats, \
+        with patch('telegram_muter.mute_chats', new_callable=AsyncMock, return_value=0) as mock_mute_chats, \
              patch('sys.argv', ['telegram_muter.py', 'mute']):
 
             result = await main()
@@ -592,9 +661,20 @@ class TestTelegramIntegration:
             assert result == 0
 
     @pytest.mark.asyncio
-    async def test_main_with_unmute_command(self, mock_settings):
+    async def test_main_with_finish_the_day_flag(self, loaded_settings):
+        """Test main function passes --finish-the-day to mute_chats"""
+        with patch('telegram_muter.mute_chats', new_callable=AsyncMock, return_value=0) as mock_mute_chats, \
+             patch('sys.argv', ['telegram_muter.py', 'mute', '--finish-the-day']):
+
+            result = await main()
+
+            mock_mute_chats.assert_called_once_with(finish_the_day=True)
+            assert result == 0
+
+    @pytest.mark.asyncio
+    async def test_main_with_unmute_command(self, loaded_settings):
         """Test main function with unmute command"""
-        with patch('telegram_muter.unmute_chats', new_callable=AsyncMock) as mock_unmute_chats, \
+        with patch('telegram_muter.unmute_chats', new_callable=AsyncMock, return_value=0) as mock_unmute_chats, \
              patch('sys.argv', ['telegram_muter.py', 'unmute']):
 
             result = await main()
@@ -603,9 +683,9 @@ class TestTelegramIntegration:
             assert result == 0
 
     @pytest.mark.asyncio
-    async def test_main_with_default_command(self, mock_settings):
+    async def test_main_with_default_command(self, loaded_settings):
         """Test main function with default (no) command"""
-        with patch('telegram_muter.mute_chats', new_callable=AsyncMock) as mock_mute_chats, \
+        with patch('telegram_muter.mute_chats', new_callable=AsyncMock, return_value=0) as mock_mute_chats, \
              patch('sys.argv', ['telegram_muter.py']):
 
             result = await main()
@@ -614,134 +694,16 @@ class TestTelegramIntegration:
             assert result == 0
 
     @pytest.mark.asyncio
-    async def test_end_of_day_protection_without_flag(self, mock_settings, mock_channel_dialog):
-        """Test that chats are not muted before end_of_day without --finish-the-day flag"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('builtins.print') as mock_print, \
-             patch('sys.argv', ['telegram_muter.py', 'mute']):
-
-            # Mock current time - before end_of_day (17:00, end_of_day is 18:00)
-            mock_time = pendulum.parse("2025-09-04T17:00:00")  # Thursday 5 PM
-            mock_now.return_value = mock_time
-
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
-
-            # Mock handle_rate_limit - should only be called for get_dialogs
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if hasattr(operation, '__name__') and operation.__name__ == 'get_dialogs':
-                    return [mock_channel_dialog]
-                return await operation(*args, **kwargs)
-
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
-
-            await main()
-
-            # Should skip the chat due to end_of_day protection
-            skip_calls = [call for call in mock_print.call_args_list
-                         if len(call.args) > 0 and 'Skipping chat' in str(call.args[0]) and 'is working hours' in str(call.args[0])]
-            assert len(skip_calls) == 1
-
-            # Should not call GetNotifySettingsRequest since chat is skipped
-            get_notify_calls = [call for call in mock_handle_rate_limit.call_args_list
-                              if 'GetNotifySettingsRequest' in str(call)]
-            assert len(get_notify_calls) == 0
-
-    @pytest.mark.asyncio
-    async def test_end_of_day_muting_after_end_time(self, mock_settings, mock_channel_dialog):
-        """Test that chats are muted after end_of_day"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('sys.argv', ['telegram_muter.py', 'mute']):
-
-            # Mock current time - after end_of_day (19:00, end_of_day is 18:00)
-            mock_time = pendulum.parse("2025-09-04T19:00:00")  # Thursday 7 PM
-            mock_now.return_value = mock_time
-
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
-
-            # Mock notify settings (group is not muted)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = None
-
-            # Configure handle_rate_limit to return appropriate values
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if hasattr(operation, '__name__') and operation.__name__ == 'get_dialogs':
-                    return [mock_channel_dialog]
-                elif 'GetNotifySettingsRequest' in str(args) if args else False:
-                    return mock_notify_settings
-                elif 'UpdateNotifySettingsRequest' in str(args) if args else False:
-                    return None
-                return await operation(*args, **kwargs)
-
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
-
-            await main()
-
-            # Should proceed with muting since it's after end_of_day
-            update_calls = [call for call in mock_handle_rate_limit.call_args_list
-                          if 'UpdateNotifySettingsRequest' in str(call)]
-            assert len(update_calls) == 1
-
-    @pytest.mark.asyncio
-    async def test_finish_the_day_bypasses_end_of_day(self, mock_settings, mock_channel_dialog):
-        """Test that --finish-the-day flag bypasses end_of_day protection"""
-        with patch('pendulum.now') as mock_now, \
-             patch('telegram_muter.settings', mock_settings), \
-             patch('telegram_muter.TelegramClient') as mock_client_class, \
-             patch('telegram_muter.handle_rate_limit', new_callable=AsyncMock) as mock_handle_rate_limit, \
-             patch('sys.argv', ['telegram_muter.py', 'mute', '--finish-the-day']):
-
-            # Mock current time - before end_of_day (17:00, end_of_day is 18:00)
-            mock_time = pendulum.parse("2025-09-04T17:00:00")  # Thursday 5 PM
-            mock_now.return_value = mock_time
+    @pytest.mark.parametrize("command", ["mute", "unmute"])
+    async def test_main_fails_when_chats_fail(self, loaded_settings, command):
+        """Test main function returns non-zero when some chats could not be muted or unmuted"""
+        with patch('telegram_muter.mute_chats', new_callable=AsyncMock, return_value=2), \
+             patch('telegram_muter.unmute_chats', new_callable=AsyncMock, return_value=2), \
+             patch('sys.argv', ['telegram_muter.py', command]):
 
-            # Mock client
-            mock_client = AsyncMock()
-            mock_client_class.return_value = mock_client
-            mock_client.connect.return_value = None
-            mock_client.is_user_authorized.return_value = True
-            mock_client.get_dialogs.return_value = [mock_channel_dialog]
-            mock_client.disconnect.return_value = None
-
-            # Mock notify settings (group is not muted)
-            mock_notify_settings = MagicMock()
-            mock_notify_settings.mute_until = None
-
-            # Configure handle_rate_limit to return appropriate values
-            async def handle_rate_limit_side_effect(operation, *args, **kwargs):
-                if hasattr(operation, '__name__') and operation.__name__ == 'get_dialogs':
-                    return [mock_channel_dialog]
-                elif 'GetNotifySettingsRequest' in str(args) if args else False:
-                    return mock_notify_settings
-                elif 'UpdateNotifySettingsRequest' in str(args) if args else False:
-                    return None
-                return await operation(*args, **kwargs)
-
-            mock_handle_rate_limit.side_effect = handle_rate_limit_side_effect
-
-            await main()
+            result = await main()
 
-            # Should proceed with muting despite being before end_of_day due to flag
-            update_calls = [call for call in mock_handle_rate_limit.call_args_list
-                          if 'UpdateNotifySettingsRequest' in str(call)]
-            assert len(update_calls) == 1
+            assert result == 1
 
 
 if __name__ == "__main__":
@@ -3,13 +3,16 @@
 # See LICENSE file.
 
 # -*- coding: utf-8 -*-
+import stat
+import tomllib
+from pathlib import Path
 import pytest
 import pendulum
-from pendulum import WeekDay, Date
+from pendulum import WeekDay, Date, Time
 from unittest.mock import patch
 from pydantic import ValidationError
 
-from telegram_muter import Settings, AuthSettings, Schedule, ScheduleManager, GroupSetting
+from telegram_muter import Settings, AuthSettings, Schedule, ScheduleManager, GroupSetting, load_settings_from_toml
 
 
 class TestScheduleSystem:
@@ -41,6 +44,24 @@ class TestScheduleSystem:
         assert schedule.timezone == "Europe/London"
         assert schedule.weekends == [WeekDay.SATURDAY, WeekDay.SUNDAY]
 
+    def test_schedule_time_parsing(self):
+        """Test parsing of start_of_day and end_of_day"""
+        schedule = Schedule(name="test", start_of_day="09:30", end_of_day="18:45:30")
+        assert schedule.start_of_day == pendulum.Time(9, 30, 0)
+        assert isinstance(schedule.start_of_day, pendulum.Time)
+        assert schedule.end_of_day == pendulum.Time(18, 45, 30)
+
+        with pytest.raises(ValidationError, match="Cannot parse 9am as Time"):
+            Schedule(name="test", start_of_day="9am")
+
+    def test_weekend_names(self):
+        """Test parsing of English and Russian weekday names"""
+        schedule = Schedule(name="test", weekends=["Fri", "Сб", "Вс"])
+        assert schedule.weekends == [WeekDay.FRIDAY, WeekDay.SATURDAY, WeekDay.SUNDAY]
+
+        with pytest.raises(ValidationError, match="Unknown weekday: Saturday"):
+            Schedule(name="test", weekends=["Saturday"])
+
     def test_schedule_inheritance_single_level(self):
         """Test schedule inheritance with one parent"""
         default_schedule = Schedule(name="default", start_of_day="08:00:00", weekends=["Mon"])
@@ -104,6 +125,51 @@ class TestScheduleSystem:
         assert len(effective.working_weekends) == 1
         assert len(effective.nonworking_weekdays) == 1
 
+    def test_effective_schedule_is_cached(self):
+        """Test that effective schedule is resolved once per schedule name"""
+        default_schedule = Schedule(name="default", start_of_day="09:00:00", weekends=["Sat", "Sun"])
+        work_schedule = Schedule(name="work", parent="default", start_of_day="08:00:00")
+
+        manager = ScheduleManager([default_schedule, work_schedule])
+
+        effective = manager.get_effective_schedule("work")
+        assert manager.get_effective_schedule("work") is effective
+        # Unknown schedules fall back to the cached default one
+        assert manager.get_effective_schedule("unknown") is manager.get_effective_schedule("default")
+
+    def test_midnight_start_of_day_is_not_inherited(self):
+        """Test that a child schedule starting at midnight keeps its own start_of_day"""
+        default_schedule = Schedule(name="default", start_of_day="09:00:00", timezone="UTC", weekends=["Sat", "Sun"])
+        night_schedule = Schedule(name="night", parent="default", start_of_day="00:00:00")
+
+        manager = ScheduleManager([default_schedule, night_schedule])
+        effective = manager.get_effective_schedule("night")
+
+        assert effective.start_of_day == Time(0, 0, 0)
+        assert effective.timezone == "UTC"
+        assert effective.weekends == [WeekDay.SATURDAY, WeekDay.SUNDAY]
+
+    def test_effective_schedule_skips_revalidation(self):
+        """Test that effective schedule reuses parsed values instead of parsing them again"""
+        default_schedule = Schedule(
+            name="default",
+            start_of_day="09:00:00",
+            weekends=["Sat", "Sun"],
+            nonworking_weekdays=[["2025-01-01", "2025-01-07"]]
+        )
+        work_schedule = Schedule(name="work", parent="default", working_weekends=["2025-01-11"])
+
+        manager = ScheduleManager([default_schedule, work_schedule])
+        with patch.object(Schedule, '_parse_iso_date', side_effect=AssertionError("parsed again")):
+            effective = manager.get_effective_schedule("work")
+
+        assert effective.start_of_day == Time(9, 0, 0)
+        assert effective.end_of_day == Time(19, 0, 0)
+        assert effective.weekends == [WeekDay.SATURDAY, WeekDay.SUNDAY]
+        assert effective.nonworking_weekdays == [(Date(2025, 1, 1), Date(2025, 1, 7))]
+        assert effective._is_working_day(Date(2025, 1, 11))
+        assert not effective._is_working_day(Date(2025, 1, 6))
+
     def test_default_schedule_required(self):
         """Test that 'default' schedule is required"""
         schedule = Schedule(name="not_default", start_of_day="09:00:00", weekends=["Sun"])
@@ -126,6 +192,25 @@ class TestScheduleSystem:
         with pytest.raises(ValueError, match="Circular dependency detected"):
             ScheduleManager([schedule1, schedule2])
 
+    def test_date_parsing(self):
+        """Test ISO8601 date parsing for working_weekends and nonworking_weekdays"""
+        schedule = Schedule(
+            name="test",
+            working_weekends=["2025-12-27"],
+            nonworking_weekdays=[["2025-12-30", "2026-01-02"]]
+        )
+        assert schedule.working_weekends == [Date(2025, 12, 27)]
+        assert isinstance(schedule.working_weekends[0], Date)
+        assert schedule.nonworking_weekdays == [(Date(2025, 12, 30), Date(2026, 1, 2))]
+
+        # Formats accepted by date.fromisoformat, but not by the config
+        for date_str in ["20251227", "2025-W52-6", "2025-12-7"]:
+            with pytest.raises(ValidationError, match="must be in ISO8601 format"):
+                Schedule(name="test", working_weekends=[date_str])
+
+        with pytest.raises(ValidationError, match="invalid date"):
+            Schedule(name="test", working_weekends=["2025-02-30"])
+
     def test_group_settings_validation(self):
         """Test GroupSetting validation"""
         # Should require either name or name_pattern
@@ -136,6 +221,10 @@ class TestScheduleSystem:
         with pytest.raises(ValueError, match="'name' and 'name_pattern' are mutually exclusive"):
             GroupSetting(name="test", name_pattern="test.*", schedule="default")
 
+        # Should reject patterns that are not valid regular expressions
+        with pytest.raises(ValueError, match="Invalid name_pattern"):
+            GroupSetting(name_pattern="test(", schedule="default")
+
     def test_group_schedule_matching_exact_name(self):
         """Test group schedule matching by exact name"""
         default_schedule = Schedule(name="default", start_of_day="09:00:00", weekends=["Sat", "Sun"])
@@ -385,6 +474,67 @@ class TestGetNextWorkingDay:
             expected = Date(2025, 1, 13)
             assert result == expected
 
+    def test_overlapping_nonworking_weekday_ranges(self):
+        """Test nonworking weekday ranges that overlap or nest each other"""
+        schedule = Schedule(
+            name="default",
+            start_of_day="09:00:00",
+            timezone="UTC",
+            weekends=["Sat", "Sun"],
+            nonworking_weekdays=[["2025-01-06", "2025-01-14"], ["2025-01-07", "2025-01-08"], "2025-01-15"]
+        )
+
+        # Mock current time to Thursday 08:00 (before start_of_day, inside the outer range only)
+        with patch('pendulum.now') as mock_now:
+            # Thursday, Jan 9, 2025 08:00 UTC
+            mock_now.return_value = pendulum.parse("2025-01-09T08:00:00+00:00")
+
+            result = schedule.get_next_working_day("UTC")
+
+            # Should return Thursday (Jan 16, 2025), skipping the whole outer range and the single date
+            expected = Date(2025, 1, 16)
+            assert result == expected
+
+    def test_every_day_is_weekend(self):
+        """Test schedules where every day is a weekend, working weekends are the only working days"""
+        schedule = Schedule(
+            name="default",
+            start_of_day="09:00:00",
+            timezone="UTC",
+            weekends=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
+            working_weekends=["2025-03-01"]
+        )
+
+        with patch('pendulum.now') as mock_now:
+            mock_now.return_value = pendulum.parse("2025-01-09T08:00:00+00:00")
+            assert schedule.get_next_working_day("UTC") == Date(2025, 3, 1)
+
+            # Past the last working weekend there is no working day at all
+            mock_now.return_value = pendulum.parse("2025-03-01T10:00:00+00:00")
+            with pytest.raises(RuntimeError, match="no working days left"):
+                schedule.get_next_working_day("UTC")
+
+            # Same without any working weekends at all
+            schedule = Schedule(name="default", start_of_day="09:00:00", timezone="UTC", weekends=list(schedule.weekends))
+            with pytest.raises(RuntimeError, match="no working days left"):
+                schedule.get_next_working_day("UTC")
+
+    def test_explicit_now(self):
+        """Test that a now passed by the caller is used instead of reading the clock again"""
+        schedule = Schedule(
+            name="default",
+            start_of_day="09:00:00",
+            timezone="UTC",
+            weekends=["Sat", "Sun"]
+        )
+
+        with patch('pendulum.now') as mock_now:
+            # Friday, Jan 10, 2025 10:00 UTC (after start_of_day)
+            result = schedule.get_next_working_day("UTC", pendulum.parse("2025-01-10T10:00:00+00:00"))
+
+            mock_now.assert_not_called()
+            assert result == Date(2025, 1, 13)
+
     def test_timezone_handling(self):
         """Test that timezone is handled correctly"""
         schedule = Schedule(
@@ -565,5 +715,77 @@ class TestIsWorkingHours:
             assert result is True
 
 
+class TestSettingsLoading:
+    """Test loading settings from TOML and the validated settings cache"""
+
+    CONFIG = """
+[auth]
+api_id = 12345
+api_hash = "test_hash"
+phone_number = "+1234567890"
+
+[[schedules]]
+name = "default"
+start_of_day = "09:00:00"
+weekends = ["Sat", "Sun"]
+working_weekends = ["2025-01-11"]
+nonworking_weekdays = [["2025-01-08", "2025-01-10"]]
+
+[[group_settings]]
+name_pattern = "duty.*"
+schedule = "default"
+"""
+
+    @pytest.fixture
+    def config_path(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+        path = tmp_path / "config.toml"
+        path.write_text(self.CONFIG)
+        return str(path)
+
+    def test_load_uses_cache_for_unchanged_file(self, config_path):
+        """Test that second load of unchanged config skips TOML parsing"""
+        settings = load_settings_from_toml(config_path)
+
+        with patch('tomllib.load') as mock_load:
+            cached = load_settings_from_toml(config_path)
+            mock_load.assert_not_called()
+
+        assert cached == settings
+        schedule = cached.schedules[0]
+        assert schedule.weekends == [WeekDay.SATURDAY, WeekDay.SUNDAY]
+        assert schedule.nonworking_weekdays == [(Date(2025, 1, 8), Date(2025, 1, 10))]
+        assert schedule._is_working_day(Date(2025, 1, 11))
+        assert not schedule._is_working_day(Date(2025, 1, 9))
+
+    def test_load_revalidates_changed_file(self, config_path):
+        """Test that changed config is parsed and validated again"""
+        load_settings_from_toml(config_path)
+
+        with open(config_path, "a") as file:
+            file.write('\n[[group_settings]]\nname = "Work Chat"\nschedule = "default"\n')
+
+        settings = load_settings_from_toml(config_path)
+        assert len(settings.group_settings) == 2
+        assert settings.group_settings[1].name == "Work Chat"
+
+    def test_load_revalidates_cache_of_other_version(self, config_path):
+        """Test that data cached by another code version is not reused"""
+        load_settings_from_toml(config_path)
+
+        with patch('muter_config._settings_cache_version', return_value="other"), \
+                patch('tomllib.load', wraps=tomllib.load) as mock_load:
+            load_settings_from_toml(config_path)
+            mock_load.assert_called_once()
+
+    def test_cache_is_private(self, config_path):
+        """Test that cached settings with credentials are readable by the owner only"""
+        load_settings_from_toml(config_path)
+
+        cache_files = list((Path(config_path).parent / "cache" / "telegram-muter").iterdir())
+        assert len(cache_files) == 1
+        assert stat.S_IMODE(cache_files[0].stat().st_mode) == 0o600
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])